@@ -1,12 +1,15 @@
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional, Protocol, Sequence, Tuple
 
 import redis.asyncio as redis
 from aiohttp.web_request import Request
 from aiohttp.web_response import Response
 
 from alxhttp.schemas import gen_prefixed_id
+from alxhttp.single_flight import SingleFlight
 
 
 def cookie_expiry(dt: datetime) -> str:
@@ -41,6 +44,217 @@ async def secure_hget(redis: redis.Redis, name: str, cookie_value: str) -> Optio
   return res.decode() if res else None
 
 
+async def secure_hdel(redis: redis.Redis, name: str, cookie_value: str) -> None:
+  """
+  Remove the secure_value stored under cookie_value by secure_hset
+  """
+  if not cookie_value.startswith(f'{name}_'):
+    raise ValueError('cookie_value is malformed')
+
+  await redis.hdel(name, cookie_value)
+
+
+class Invalidation(Protocol):
+  """
+  Tells every process's SecureValueCache to forget a cookie value
+  """
+
+  async def publish(self, name: str, cookie_value: str) -> None: ...
+
+
+class SecureValueCache:
+  """
+  A bounded LRU of secure_hget results keyed by (hash name, cookie value), so that an
+  authenticated request doesn't need a Redis round trip every time. Values are kept for
+  ttl seconds and misses (unknown cookie values) for negative_ttl seconds.
+
+  Anything that changes a stored value must go through invalidate so that the caches
+  in other processes drop it too, otherwise they can serve it for up to ttl seconds.
+  """
+
+  def __init__(self, maxsize: int = 10_000, ttl: float = 30.0, negative_ttl: float = 5.0, invalidation: Optional[Invalidation] = None):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.invalidation = invalidation
+    self._entries: OrderedDict[Tuple[str, str], Tuple[float, Optional[str]]] = OrderedDict()
+    self.hits = 0
+    self.negative_hits = 0
+    self.misses = 0
+    self.evictions = 0
+    # Bumped by every discard, so a lookup that raced with one doesn't cache what it read
+    self.generation = 0
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def get(self, name: str, cookie_value: str) -> Tuple[bool, Optional[str]]:
+    """
+    (found, value), where a found value of None is a cached miss
+    """
+    key = (name, cookie_value)
+    entry = self._entries.get(key)
+    if entry is None:
+      self.misses += 1
+      return False, None
+    expires_at, value = entry
+    if expires_at <= monotonic():
+      del self._entries[key]
+      self.misses += 1
+      return False, None
+    self._entries.move_to_end(key)
+    if value is None:
+      self.negative_hits += 1
+    else:
+      self.hits += 1
+    return True, value
+
+  def put(self, name: str, cookie_value: str, value: Optional[str]) -> None:
+    key = (name, cookie_value)
+    self._entries[key] = (monotonic() + (self.ttl if value is not None else self.negative_ttl), value)
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.maxsize:
+      self._entries.popitem(last=False)
+      self.evictions += 1
+
+  def discard(self, name: str, cookie_value: str) -> None:
+    """
+    Forget a cookie value in this process only
+    """
+    self.generation += 1
+    self._entries.pop((name, cookie_value), None)
+
+  async def invalidate(self, name: str, cookie_value: str) -> None:
+    """
+    Forget a cookie value here and, via the invalidation channel, everywhere else
+    """
+    self.discard(name, cookie_value)
+    if self.invalidation is not None:
+      await self.invalidation.publish(name, cookie_value)
+
+  def clear(self) -> None:
+    self.generation += 1
+    self._entries.clear()
+
+  @property
+  def hit_rate(self) -> float:
+    """
+    The fraction of lookups answered without Redis, including cached misses
+    """
+    lookups = self.hits + self.negative_hits + self.misses
+    return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+  def stats(self) -> Dict[str, float]:
+    return {
+      'size': len(self._entries),
+      'maxsize': self.maxsize,
+      'hits': self.hits,
+      'negative_hits': self.negative_hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hit_rate': self.hit_rate,
+    }
+
+
+class LocalInvalidation:
+  """
+  Invalidation between caches in one process, a stand-in for RedisInvalidation in tests
+  and single process servers
+  """
+
+  def __init__(self):
+    self.caches: List[SecureValueCache] = []
+
+  def subscribe(self, cache: SecureValueCache) -> None:
+    self.caches.append(cache)
+
+  async def publish(self, name: str, cookie_value: str) -> None:
+    for cache in self.caches:
+      cache.discard(name, cookie_value)
+
+
+class RedisInvalidation:
+  """
+  Invalidation between processes over Redis pub/sub. Every process runs listen for its
+  cache, e.g. as a background task started from the app's setup_ctx.
+  """
+
+  def __init__(self, redis: redis.Redis, channel: str = 'alxhttp:secure_value_invalidation'):
+    self.redis = redis
+    self.channel = channel
+
+  async def publish(self, name: str, cookie_value: str) -> None:
+    await self.redis.publish(self.channel, f'{name}\n{cookie_value}')
+
+  async def listen(self, cache: SecureValueCache) -> None:
+    async with self.redis.pubsub() as pubsub:
+      await pubsub.subscribe(self.channel)
+      # Anything published before the subscription went through may have been missed
+      cache.clear()
+      async for message in pubsub.listen():
+        if message['type'] != 'message':
+          continue
+        data = message['data']
+        name, _, cookie_value = (data.decode() if isinstance(data, bytes) else data).partition('\n')
+        cache.discard(name, cookie_value)
+
+
+async def _cached_lookup(cache: SecureValueCache, name: str, cookie_value: str, fetch: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+  found, value = cache.get(name, cookie_value)
+  if found:
+    return value
+  generation = cache.generation
+  value = await fetch()
+  if cache.generation == generation:
+    cache.put(name, cookie_value, value)
+  return value
+
+
+async def cached_secure_hget(redis: redis.Redis, name: str, cookie_value: str, cache: SecureValueCache) -> Optional[str]:
+  """
+  secure_hget, answered from cache where possible
+  """
+  return await _cached_lookup(cache, name, cookie_value, lambda: secure_hget(redis, name, cookie_value))
+
+
+def _session_key(name: str, cookie_value: str) -> str:
+  if not cookie_value.startswith(f'{name}_'):
+    raise ValueError('cookie_value is malformed')
+  return f'{name}:{cookie_value}'
+
+
+async def secure_setex(redis: redis.Redis, name: str, secure_values: Sequence[str], expiry_delta: timedelta) -> List[str]:
+  """
+  Like secure_hset, but each secure_value gets its own key {name}:{cookie_value} that
+  Redis expires after expiry_delta. All of them are written in one round trip.
+  """
+  # Redis expiries are whole seconds and it refuses ex=0
+  if expiry_delta < timedelta(seconds=1):
+    raise ValueError('expiry_delta must be at least one second')
+  cookie_values = [gen_prefixed_id(f'{name}_', num_bytes=32) for _ in secure_values]
+  async with redis.pipeline(transaction=False) as pipe:
+    for cookie_value, secure_value in zip(cookie_values, secure_values):
+      pipe.set(_session_key(name, cookie_value), secure_value.encode(), ex=expiry_delta)
+    await pipe.execute()
+  return cookie_values
+
+
+async def secure_mget(redis: redis.Redis, name: str, cookie_values: Sequence[str]) -> List[Optional[str]]:
+  """
+  The secure_values stored by secure_setex for many cookie values in one MGET, with
+  None for any that are unknown or expired
+  """
+  if not cookie_values:
+    return []
+  res = await redis.mget([_session_key(name, cookie_value) for cookie_value in cookie_values])
+  return [r.decode() if r else None for r in res]
+
+
+async def secure_delete(redis: redis.Redis, name: str, cookie_values: Sequence[str]) -> None:
+  if cookie_values:
+    await redis.delete(*[_session_key(name, cookie_value) for cookie_value in cookie_values])
+
+
 @dataclass
 class PlainCookie:
   """
@@ -95,10 +309,19 @@ class RedisHiddenCookie(HiddenCookie):
   A cookie {name} that JS cannot read, along with a companion cookie {name}_is_set that JS can
   query to see if the hidden cookie is currently set. The value of the hidden cookie is a random
   value that can be used by the backend to lookup a truly secret value.
+
+  With a cache, lookups of the secret value are answered in-process for up to cache.ttl
+  seconds. With coalesce, concurrent lookups of the same cookie value (e.g. a page's
+  parallel API calls) share a single Redis round trip.
   """
 
+  cache: Optional[SecureValueCache] = None
+  coalesce: bool = False
+  _lookups: SingleFlight[Tuple[redis.Redis, str], Optional[str]] = field(default_factory=SingleFlight, init=False, repr=False, compare=False)
+
   async def set(self, redis: redis.Redis, res: Response, secure_value: str, expiry_delta: timedelta | None = None) -> None:
-    cookie_value = await secure_hset(redis, self.name, secure_value)
+    expiry_delta = expiry_delta or self.expiry_delta
+    cookie_value = await self._store(redis, secure_value, expiry_delta)
 
     super().set(res, cookie_value, expiry_delta)
 
@@ -108,4 +331,76 @@ class RedisHiddenCookie(HiddenCookie):
     if not cookie_value:
       return None
 
+    if self.cache is not None:
+      return await _cached_lookup(self.cache, self.name, cookie_value, lambda: self._coalesced_fetch(redis, cookie_value))
+    return await self._coalesced_fetch(redis, cookie_value)
+
+  async def invalidate(self, redis: redis.Redis, req: Request, res: Response) -> None:
+    """
+    Delete the secret value from Redis (and any caches) as well as unsetting the cookies.
+    unset only does the latter.
+    """
+    cookie_value = req.cookies.get(self.name)
+    if cookie_value:
+      await self._delete(redis, cookie_value)
+      if self.cache is not None:
+        await self.cache.invalidate(self.name, cookie_value)
+
+    self.unset(res)
+
+  async def _coalesced_fetch(self, redis: redis.Redis, cookie_value: str) -> Optional[str]:
+    if self.coalesce:
+      # Keyed by client too, different clients may be different servers or databases
+      return await self._lookups.do((redis, cookie_value), lambda: self._fetch(redis, cookie_value))
+    return await self._fetch(redis, cookie_value)
+
+  async def _store(self, redis: redis.Redis, secure_value: str, expiry_delta: timedelta) -> str:
+    return await secure_hset(redis, self.name, secure_value)
+
+  async def _fetch(self, redis: redis.Redis, cookie_value: str) -> Optional[str]:
     return await secure_hget(redis, self.name, cookie_value)
+
+  async def _delete(self, redis: redis.Redis, cookie_value: str) -> None:
+    await secure_hdel(redis, self.name, cookie_value)
+
+
+@dataclass
+class RedisSessionCookie(RedisHiddenCookie):
+  """
+  A RedisHiddenCookie whose secret values are stored one key per cookie (see
+  secure_setex) and expire from Redis along with the cookie, rather than living forever
+  in the {name} hash. No expiry is ever longer than max_expiry_delta.
+  """
+
+  max_expiry_delta: timedelta = timedelta(days=30)
+
+  def _bounded(self, expiry_delta: timedelta) -> timedelta:
+    return min(expiry_delta, self.max_expiry_delta)
+
+  async def set(self, redis: redis.Redis, res: Response, secure_value: str, expiry_delta: timedelta | None = None) -> None:
+    # The cookie expires along with its key
+    await super().set(redis, res, secure_value, self._bounded(expiry_delta or self.expiry_delta))
+
+  async def set_many(self, redis: redis.Redis, secure_values: Sequence[str], expiry_delta: timedelta | None = None) -> List[str]:
+    """
+    Store many secret values in one round trip, returning their cookie values
+    """
+    return await secure_setex(redis, self.name, secure_values, self._bounded(expiry_delta or self.expiry_delta))
+
+  async def get_many(self, redis: redis.Redis, cookie_values: Sequence[str]) -> List[Optional[str]]:
+    """
+    Look up many cookie values in one round trip, e.g. from a background job. This
+    doesn't go through the cache. Malformed cookie values are None, like unknown ones.
+    """
+    well_formed = [cookie_value for cookie_value in cookie_values if cookie_value.startswith(f'{self.name}_')]
+    found = dict(zip(well_formed, await secure_mget(redis, self.name, well_formed)))
+    return [found.get(cookie_value) for cookie_value in cookie_values]
+
+  async def _store(self, redis: redis.Redis, secure_value: str, expiry_delta: timedelta) -> str:
+    return (await secure_setex(redis, self.name, [secure_value], expiry_delta))[0]
+
+  async def _fetch(self, redis: redis.Redis, cookie_value: str) -> Optional[str]:
+    return (await secure_mget(redis, self.name, [cookie_value]))[0]
+
+  async def _delete(self, redis: redis.Redis, cookie_value: str) -> None:
+    await secure_delete(redis, self.name, [cookie_value])
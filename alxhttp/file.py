@@ -1,9 +1,296 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional, Tuple
+
 from aiohttp.typedefs import Handler, PathLike
-from aiohttp.web import FileResponse
+from aiohttp.web import FileResponse, HTTPNotFound, Request, Response, StreamResponse, UrlDispatcher
+
+from alxhttp.file_watcher import is_watched, register_dir_listener, register_file_listener
+
+# Precompressed siblings, in order of preference
+ENCODING_EXTENSIONS = (('br', '.br'), ('gzip', '.gz'))
+
+DEFAULT_MAX_CACHED_SIZE = 256 * 1024
+
+
+@dataclass(frozen=True)
+class _Variant:
+  encoding: Optional[str]
+  body: bytes
+  etag: str
+
+
+@dataclass(frozen=True)
+class _CachedFile:
+  # (st_mtime_ns, st_ino, st_size) of the file and each sibling, None where there isn't one
+  key: Tuple[Optional[Tuple[int, int, int]], ...]
+  content_type: str
+  last_modified: float
+  variants: Tuple[_Variant, ...]
+
+
+def _stat_key(path: Path) -> Optional[Tuple[int, int, int]]:
+  try:
+    st = os.stat(path)
+  except FileNotFoundError:
+    return None
+  return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def _accepted_encodings(accept_encoding: str) -> FrozenSet[str]:
+  accepted = set()
+  for part in accept_encoding.lower().split(','):
+    coding, _, params = part.partition(';')
+    params = params.strip()
+    if params.startswith('q='):
+      try:
+        if float(params[2:]) == 0:
+          continue
+      except ValueError:
+        continue
+    accepted.add(coding.strip())
+  return frozenset(accepted)
+
+
+class StaticFile:
+  """
+  Serves one file from handler. Files up to max_cached_size bytes are read once and
+  served from memory, along with any precompressed .br / .gz siblings, with a strong
+  ETag (a hash of the content) so If-None-Match gets a 304. Larger files are left to
+  aiohttp's FileResponse, which uses sendfile.
+
+  While the file watcher (see alxhttp.file_watcher.watch_dir) covers the file, nothing
+  is stat'ed per request: the cached copy is marked stale when the watcher reports the
+  file or a sibling changed, was replaced or was deleted. Without a watcher each request
+  stats the file and its siblings instead. Either way the file is only re-read if its
+  mtime, inode or size actually changed.
+  """
+
+  def __init__(self, path: PathLike, max_cached_size: int = DEFAULT_MAX_CACHED_SIZE, cache_control: Optional[str] = None, watch: bool = True):
+    self.path = Path(path).resolve()
+    self.max_cached_size = max_cached_size
+    self.cache_control = cache_control
+    self._entry: Optional[_CachedFile] = None
+    # The file's stat key when it was last found to be over max_cached_size
+    self._too_large: Optional[Tuple[int, int, int]] = None
+    self._stale = True
+    self._paths = [self.path, *(self.path.with_name(self.path.name + ext) for _, ext in ENCODING_EXTENSIONS)]
+    if watch:
+      for watched in self._paths:
+        register_file_listener(watched, self.invalidate)
+
+  def _stat_keys(self) -> Tuple[Optional[Tuple[int, int, int]], ...]:
+    return tuple(_stat_key(p) for p in self._paths)
+
+  def invalidate(self) -> None:
+    """
+    Called from the file watcher thread
+    """
+    self._stale = True
+
+  def _load(self) -> Optional[_CachedFile]:
+    self._stale = False
+    paths = self._paths
+    key = self._stat_keys()
+    if self._entry is not None and self._entry.key == key:
+      return self._entry
+    if key[0] is None:
+      self._entry = None
+      self._too_large = None
+      # Look again next time in case it appears
+      self._stale = True
+      raise HTTPNotFound()
+
+    st = os.stat(self.path)
+    if st.st_size > self.max_cached_size:
+      self._entry = None
+      self._too_large = key[0]
+      return None
+    self._too_large = None
+
+    variants = []
+    for (encoding, _), path, sibling_key in zip(ENCODING_EXTENSIONS, paths[1:], key[1:]):
+      if sibling_key is not None:
+        variants.append(self._variant(encoding, path.read_bytes()))
+    variants.append(self._variant(None, self.path.read_bytes()))
+
+    self._entry = _CachedFile(
+      key=key,
+      content_type=mimetypes.guess_type(self.path.name)[0] or 'application/octet-stream',
+      last_modified=st.st_mtime,
+      variants=tuple(variants),
+    )
+    return self._entry
+
+  @staticmethod
+  def _variant(encoding: Optional[str], body: bytes) -> _Variant:
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return _Variant(encoding=encoding, body=body, etag=f'{digest}-{encoding}' if encoding else digest)
+
+  def _choose(self, entry: _CachedFile, request: Request) -> _Variant:
+    if len(entry.variants) > 1:
+      accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+      for variant in entry.variants:
+        if variant.encoding is None or variant.encoding in accepted:
+          return variant
+    return entry.variants[-1]
+
+  async def handler(self, request: Request) -> StreamResponse:
+    headers = {'Cache-Control': self.cache_control} if self.cache_control else {}
+    if self._too_large is not None and not self._stale:
+      # Straight to FileResponse (which handles the siblings itself), only checking the
+      # file is still too large when there's no watcher to say it changed
+      if is_watched(self.path) or _stat_key(self.path) == self._too_large:
+        return FileResponse(self.path, headers=headers)
+      self._stale = True
+
+    entry = self._entry
+    if not self._stale and not is_watched(self.path) and (entry is None or entry.key != self._stat_keys()):
+      self._stale = True
+    if self._stale:
+      entry = await asyncio.get_running_loop().run_in_executor(None, self._load)
+
+    if entry is None:
+      return FileResponse(self.path, headers=headers)
+
+    variant = self._choose(entry, request)
+    if len(entry.variants) > 1:
+      headers['Vary'] = 'Accept-Encoding'
+
+    if (if_none_match := request.if_none_match) is not None and any(etag.value in (variant.etag, '*') for etag in if_none_match):
+      resp = Response(status=304, headers=headers)
+    else:
+      resp = Response(body=variant.body, content_type=entry.content_type, headers=headers)
+      if variant.encoding:
+        resp.headers['Content-Encoding'] = variant.encoding
+    resp.etag = variant.etag
+    resp.last_modified = entry.last_modified
+    return resp
+
+
+def get_file(path: PathLike, max_cached_size: int = DEFAULT_MAX_CACHED_SIZE, cache_control: Optional[str] = None) -> Handler:
+  return StaticFile(path, max_cached_size=max_cached_size, cache_control=cache_control).handler
+
+
+# A content hash directly before the extension, as written by webpack / vite / esbuild,
+# e.g. main.3f2a1b4c.js, index-BXa9Q2fz.css or chunk.0123456789abcdef.js.map: 8 base62
+# characters (or 16, 20 or 32 of hex) with both letters and digits in them
+HASHED_NAME = re.compile(r'[.-](?=[A-Za-z0-9_]*[A-Za-z])(?=[A-Za-z0-9_]*[0-9])(?:[A-Za-z0-9_]{8}|[0-9a-f]{16}|[0-9a-f]{20}|[0-9a-f]{32})(?:\.[A-Za-z0-9]+){1,2}$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class StaticDirectory:
+  """
+  Serves everything under directory from handler, e.g. a built frontend bundle. The
+  directory is scanned once into an immutable index of relative path -> StaticFile, so a
+  request is a single dict lookup and anything not in the index is a 404 without
+  touching the filesystem. Names matching hashed_name get immutable cache headers,
+  everything else gets cache_control. A directory's index_name file is also served at
+  the directory's path.
+
+  The file watcher (which must be watching a directory containing this one) updates the
+  index one path at a time by swapping in a new copy, so lookups never see it half built.
+  """
+
+  def __init__(
+    self,
+    directory: PathLike,
+    max_cached_size: int = DEFAULT_MAX_CACHED_SIZE,
+    cache_control: Optional[str] = None,
+    hashed_name: Optional[re.Pattern[str]] = HASHED_NAME,
+    index_name: Optional[str] = 'index.html',
+    watch: bool = True,
+  ):
+    self.directory = Path(directory).resolve()
+    self.max_cached_size = max_cached_size
+    self.cache_control = cache_control
+    self.hashed_name = hashed_name
+    self.index_name = index_name
+    self.index: Mapping[str, StaticFile] = self._build()
+    if watch:
+      register_dir_listener(self.directory, self._on_change)
+
+  def _keys(self, rel: str) -> List[str]:
+    keys = [rel]
+    if self.index_name is not None and posixpath.basename(rel) == self.index_name:
+      parent = posixpath.dirname(rel)
+      keys += [parent, f'{parent}/'] if parent else ['']
+    return keys
+
+  def _static_file(self, rel: str) -> StaticFile:
+    immutable = self.hashed_name is not None and self.hashed_name.search(posixpath.basename(rel)) is not None
+    return StaticFile(
+      self.directory / rel,
+      max_cached_size=self.max_cached_size,
+      cache_control=IMMUTABLE_CACHE_CONTROL if immutable else self.cache_control,
+      watch=False,
+    )
+
+  def _is_sibling(self, path: Path) -> bool:
+    """
+    Precompressed siblings are served by their original's StaticFile
+    """
+    return any(path.name.endswith(ext) and path.with_name(path.name[: -len(ext)]).is_file() for _, ext in ENCODING_EXTENSIONS)
+
+  def _build(self) -> Mapping[str, StaticFile]:
+    index: Dict[str, StaticFile] = {}
+    for root, _, files in os.walk(self.directory):
+      for name in files:
+        path = Path(root) / name
+        if self._is_sibling(path):
+          continue
+        rel = path.relative_to(self.directory).as_posix()
+        static_file = self._static_file(rel)
+        for key in self._keys(rel):
+          index[key] = static_file
+    return MappingProxyType(index)
+
+  def _on_change(self, path: str, is_directory: bool) -> None:
+    """
+    Called from the file watcher thread
+    """
+    if is_directory:
+      # Rare enough (e.g. a whole directory moved in) to just start again
+      self.index = self._build()
+      return
+
+    changed = Path(path)
+    for _, ext in ENCODING_EXTENSIONS:
+      if changed.name.endswith(ext) and changed.with_name(changed.name[: -len(ext)]).is_file():
+        changed = changed.with_name(changed.name[: -len(ext)])
+        break
+    rel = changed.relative_to(self.directory).as_posix()
 
+    current = self.index.get(rel)
+    if changed.is_file() and not self._is_sibling(changed):
+      if current is not None:
+        # Same file, the StaticFile re-reads it (and its siblings) only if it changed
+        current.invalidate()
+        return
+      index = dict(self.index)
+      static_file = self._static_file(rel)
+      for key in self._keys(rel):
+        index[key] = static_file
+    elif current is not None:
+      index = dict(self.index)
+      for key in self._keys(rel):
+        index.pop(key, None)
+    else:
+      return
+    self.index = MappingProxyType(index)
 
-def get_file(path: PathLike) -> Handler:
-  async def handler(_):
-    return FileResponse(path)
+  async def handler(self, request: Request) -> StreamResponse:
+    static_file = self.index.get(request.match_info['path'])
+    if static_file is None:
+      raise HTTPNotFound()
+    return await static_file.handler(request)
 
-  return handler
+  def add_mount(self, router: UrlDispatcher, prefix: str = '/static') -> None:
+    router.add_get(prefix.rstrip('/') + '/{path:.*}', self.handler)
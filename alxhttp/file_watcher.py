@@ -2,40 +2,113 @@ import os
 import sys
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Callable, Dict, Generator
+from typing import Callable, Dict, Generator, List, Optional
 
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
-_watched_files: Dict[str, Callable] = {}
+_watched_files: Dict[str, List[Callable]] = {}
+_watched_dirs: Dict[str, Callable[[str, bool], None]] = {}
+# Directories that watch_dir currently has an observer on
+_watch_roots: List[str] = []
 
 
 def register_file_listener(file: str | Path, callback: Callable) -> None:
+  """
+  callback() is called whenever file is modified, created, deleted or moved into place.
+  A file can have any number of listeners, and needn't exist yet.
+  """
   global _watched_files
-  _watched_files[str(file)] = callback
-  print(f'watching {file}')
+  _watched_files[str(file)] = [*_watched_files.get(str(file), []), callback]
+  if os.path.exists(file):
+    print(f'watching {file}')
 
 
-def unregister_file_listener(
-  file: str | Path,
-) -> None:
+def unregister_file_listener(file: str | Path, callback: Optional[Callable] = None) -> None:
+  """
+  Remove callback, or every listener on file if it's None
+  """
   global _watched_files
-  del _watched_files[str(file)]
+  callbacks = [c for c in _watched_files[str(file)] if callback is not None and c != callback]
+  if callbacks:
+    _watched_files[str(file)] = callbacks
+  else:
+    del _watched_files[str(file)]
+
+
+def register_dir_listener(directory: str | Path, callback: Callable[[str, bool], None]) -> None:
+  """
+  callback(path, is_directory) is called for anything created, modified, deleted or
+  moved (once for each end of the move) anywhere under directory
+  """
+  global _watched_dirs
+  _watched_dirs[os.path.join(str(directory), '')] = callback
+  print(f'watching {directory}')
+
+
+def unregister_dir_listener(directory: str | Path) -> None:
+  global _watched_dirs
+  del _watched_dirs[os.path.join(str(directory), '')]
+
+
+def is_watched(path: str | Path) -> bool:
+  """
+  Whether changes to path are currently being reported to listeners
+  """
+  path = str(path)
+  return any(path.startswith(root) for root in _watch_roots)
+
+
+def _notify_file(path: str) -> None:
+  # Lists are replaced rather than changed in place, so this is safe from the watcher thread
+  callbacks = _watched_files.get(path)
+  if not callbacks:
+    return
+  for callback in callbacks:
+    try:
+      callback()
+    except Exception as e:
+      print(e)
+  print(f'reloaded: {path}')
+
+
+def _notify_dirs(path: str, is_directory: bool) -> None:
+  for directory, callback in list(_watched_dirs.items()):
+    if path.startswith(directory):
+      try:
+        callback(path, is_directory)
+      except Exception as e:
+        print(e)
 
 
 class FSWatchHandler(FileSystemEventHandler):
+  """
+  File listeners hear about files being created, deleted or moved into place (e.g. an
+  atomic os.replace) as well as modified
+  """
+
+  def on_created(self, event: FileSystemEvent) -> None:
+    _notify_dirs(str(event.src_path), event.is_directory)
+    if not event.is_directory:
+      _notify_file(str(event.src_path))
+
+  def on_deleted(self, event: FileSystemEvent) -> None:
+    _notify_dirs(str(event.src_path), event.is_directory)
+    if not event.is_directory:
+      _notify_file(str(event.src_path))
+
+  def on_moved(self, event: FileSystemEvent) -> None:
+    _notify_dirs(str(event.src_path), event.is_directory)
+    _notify_dirs(str(event.dest_path), event.is_directory)
+    if not event.is_directory:
+      _notify_file(str(event.src_path))
+      _notify_file(str(event.dest_path))
+
   def on_modified(self, event: FileSystemEvent) -> None:
     if event.is_directory:
       return None
-    modified_file = str(event.src_path)
-    if callback := _watched_files.get(modified_file):
-      try:
-        callback()
-        print(f'reloaded: {event.src_path}')
-      except Exception as e:
-        print(e)
-    else:
-      pass
+    _notify_dirs(str(event.src_path), False)
+    _notify_file(str(event.src_path))
 
 
 @contextmanager
@@ -46,9 +119,12 @@ def watch_dir(watch_dir: Path | None = None) -> Generator[None, None, None]:
   observer = Observer()
   observer.schedule(event_handler, watch_dir, recursive=True)
   observer.start()
+  root = os.path.join(os.path.abspath(watch_dir), '')
+  _watch_roots.append(root)
   try:
     print(f'watching {watch_dir}')
     yield
   finally:
+    _watch_roots.remove(root)
     observer.stop()
     observer.join()
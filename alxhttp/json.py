@@ -1,6 +1,7 @@
 import json
+import os
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Dict, List
 
 import pydantic
 from aiohttp import web
@@ -8,6 +9,19 @@ from aiohttp.web import Request, Response
 
 from alxhttp.req_id import get_request_id
 
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import msgspec
+except ImportError:
+  msgspec = None
+
+
+JSONDumper = Callable[[Any], bytes]
+
 
 def json_default(x: Any) -> Any:
   if isinstance(x, datetime):
@@ -17,12 +31,94 @@ def json_default(x: Any) -> Any:
   return str(x)
 
 
+_compact_separators = (',', ':')
+
+
+def _stdlib_dumps(x: Any) -> bytes:
+  return json.dumps(x, separators=_compact_separators, default=json_default).encode()
+
+
+def _compat_dumps(x: Any) -> bytes:
+  """
+  The historical output format: sorted keys with newlines between items
+  """
+  return json.dumps(x, indent=0, sort_keys=True, default=json_default).encode()
+
+
+_json_backends: Dict[str, JSONDumper] = {
+  'stdlib': _stdlib_dumps,
+  'compat': _compat_dumps,
+}
+
+if orjson is not None:
+  # datetimes and dataclasses are passed through to json_default, so datetimes stay float
+  # timestamps and dataclasses str() like the stdlib backend. UUIDs come out the same
+  # either way. What orjson can't be told to pass through, and so differs from stdlib:
+  # plain Enum members are written as their value rather than str(member), and NaN /
+  # Infinity as null rather than the (invalid JSON) NaN / Infinity
+  _orjson_options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+  def _orjson_dumps(x: Any) -> bytes:
+    try:
+      return orjson.dumps(x, default=json_default, option=_orjson_options)
+    except orjson.JSONEncodeError:
+      # e.g. integers wider than 64 bits
+      return _stdlib_dumps(x)
+
+  _json_backends['orjson'] = _orjson_dumps
+
+if msgspec is not None:
+  # msgspec always encodes datetimes natively as RFC 3339 strings rather than timestamps,
+  # so it is never picked automatically
+  _msgspec_encoder = msgspec.json.Encoder(enc_hook=json_default)
+  _json_backends['msgspec'] = _msgspec_encoder.encode
+
+
+def register_json_backend(name: str, dumper: JSONDumper) -> None:
+  _json_backends[name] = dumper
+
+
+def _default_json_backend() -> str:
+  name = os.environ.get('ALXHTTP_JSON_BACKEND')
+  if name and name in _json_backends:
+    return name
+  return 'orjson' if 'orjson' in _json_backends else 'stdlib'
+
+
+_json_backend_name = _default_json_backend()
+_json_dumpb: JSONDumper = _json_backends[_json_backend_name]
+
+
+def set_json_backend(name: str) -> None:
+  """
+  Select the serializer used by json_dumps/json_dumpb/json_response. 'compat' keeps
+  the old sorted + indented output.
+  """
+  global _json_backend_name, _json_dumpb
+  if name not in _json_backends:
+    raise ValueError(f'Unknown json backend: {name}')
+  _json_backend_name = name
+  _json_dumpb = _json_backends[name]
+
+
+def get_json_backend() -> str:
+  return _json_backend_name
+
+
+def available_json_backends() -> List[str]:
+  return list(_json_backends.keys())
+
+
+def json_dumpb(x: Any) -> bytes:
+  return _json_dumpb(x)
+
+
 def json_dumps(x: Any) -> str:
-  return json.dumps(x, indent=0, sort_keys=True, default=json_default)
+  return _json_dumpb(x).decode()
 
 
 def json_response(x: Any, status: int = 200) -> web.Response:
-  return web.json_response(text=json_dumps(x), status=status)
+  return web.Response(body=_json_dumpb(x), status=status, content_type='application/json', charset='utf-8')
 
 
 def json_error_response(req: Request, error: str, status_code: int, rest: dict | None = None) -> Response:
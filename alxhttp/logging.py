@@ -1,12 +1,19 @@
 import logging
+import os
+import queue
+import random
+import sys
+import threading
+from dataclasses import dataclass, field
 from json import dumps
-from time import time_ns
-from typing import Any
+from time import monotonic, time_ns
+from typing import Any, ClassVar, Dict, List, Literal, NamedTuple, Optional, TextIO, Tuple
 
 from aiohttp.abc import AbstractAccessLogger
 from aiohttp.web import BaseRequest, StreamResponse
+from yarl import URL
 
-from alxhttp.req_id import get_request, get_request_id, get_trace_id
+from alxhttp.req_id import current_log_context, current_request, get_request_id, get_trace_id
 
 _compact_separators = (',', ':')
 
@@ -20,67 +27,439 @@ def compact_json(obj: Any) -> str:
   )
 
 
+def _access_log_record(
+  method: str,
+  path: str,
+  status: int,
+  url: str,
+  duration: float,
+  ts_ns: int,
+  request_id: str,
+  trace_id: str,
+  sample_rate: Optional[float] = None,
+) -> Dict[str, Any]:
+  """
+  Taking some naming conventions from:
+  https://github.com/opentracing/specification/blob/master/semantic_conventions.md
+  """
+  record: Dict[str, Any] = {
+    'message': f'{method} {path} {status}',
+    'duration': round(duration, 8),
+    'time_ns': ts_ns,
+    'http': {
+      'method': method,
+      'status_code': status,
+      'url': url,
+    },
+    'component': 'aiohttp',
+    'request_id': request_id,
+    'traceId': trace_id,
+  }
+  if sample_rate is not None:
+    record['sample_rate'] = sample_rate
+  return record
+
+
+@dataclass
+class _RouteBucket:
+  tokens: float
+  refilled_at: float
+  window_start: float
+  seen: int = 0
+  kept: int = 0
+  # kept / seen over the previous one second window, if there was traffic in it
+  last_rate: Optional[float] = None
+  total_seen: int = 0
+  total_kept: int = 0
+
+
+@dataclass
+class AccessLogSampler:
+  """
+  Decides which access log lines to keep. Errors (status >= 400) and requests slower
+  than slow_threshold seconds are always kept. Everything else is sampled per route
+  template, either with a fixed probability (rate, overridden per route by
+  route_rates) or, when per_second is set, with a token bucket that lets through at
+  most per_second lines a second per route (plus bursts of up to burst).
+
+  sample() returns the rate the kept line was sampled at, so that counts can be
+  re-weighted downstream, or None if the line should be dropped. For the token bucket
+  that is the fraction of the route's lines kept over the previous second, which is
+  only an estimate (and 1.0 until a second has passed); totals() has exact counts.
+  """
+
+  rate: float = 1.0
+  route_rates: Dict[str, float] = field(default_factory=dict)
+  per_second: Optional[float] = None
+  burst: float = 1.0
+  slow_threshold: float = 1.0
+  _buckets: Dict[str, _RouteBucket] = field(default_factory=dict, repr=False)
+
+  def sample(self, route: str, status: int, duration: float) -> Optional[float]:
+    if status >= 400 or duration >= self.slow_threshold:
+      return 1.0
+
+    if self.per_second is not None:
+      return self._sample_token_bucket(route, self.per_second)
+
+    rate = self.route_rates.get(route, self.rate)
+    if rate >= 1.0:
+      return 1.0
+    if random.random() < rate:
+      return rate
+    return None
+
+  def totals(self) -> Dict[str, Tuple[int, int]]:
+    """
+    (seen, kept) per route for the lines the token bucket decided on, i.e. not counting
+    errors and slow requests which are always kept
+    """
+    return {route: (bucket.total_seen, bucket.total_kept) for route, bucket in self._buckets.items()}
+
+  def _sample_token_bucket(self, route: str, per_second: float) -> Optional[float]:
+    now = monotonic()
+    bucket = self._buckets.get(route)
+    if bucket is None:
+      bucket = self._buckets[route] = _RouteBucket(tokens=max(self.burst, 1.0), refilled_at=now, window_start=now)
+
+    if now - bucket.window_start >= 1.0:
+      # Only a window that just ended says anything about the current traffic
+      bucket.last_rate = bucket.kept / bucket.seen if bucket.seen and now - bucket.window_start < 2.0 else None
+      bucket.seen = bucket.kept = 0
+      bucket.window_start = now
+    bucket.seen += 1
+    bucket.total_seen += 1
+
+    bucket.tokens = min(max(self.burst, 1.0), bucket.tokens + (now - bucket.refilled_at) * per_second)
+    bucket.refilled_at = now
+    if bucket.tokens < 1.0:
+      return None
+    bucket.tokens -= 1.0
+    bucket.kept += 1
+    bucket.total_kept += 1
+
+    return bucket.last_rate if bucket.last_rate is not None else 1.0
+
+
+def _route_key(request: BaseRequest) -> str:
+  """
+  The route template (e.g. /api/users/{user_id}) rather than the path, so that
+  sampling state doesn't grow with the number of distinct URLs
+  """
+  match_info = getattr(request, 'match_info', None)
+  resource = match_info.route.resource if match_info is not None else None
+  return resource.canonical if resource is not None else ''
+
+
 class JSONAccessLogger(AbstractAccessLogger):
+  """
+  Set sampler (e.g. in a subclass) to only log some of the successful requests. Kept
+  lines then carry a sample_rate field.
+  """
+
+  sampler: ClassVar[Optional[AccessLogSampler]] = None
+
   def __init__(self, logger: logging.Logger, log_format: str):
     super().__init__(logger, log_format)
 
+  def _sample(self, request: BaseRequest, response: StreamResponse, time: float) -> Tuple[bool, Optional[float]]:
+    """
+    (keep, sample_rate), where sample_rate is None without a sampler
+    """
+    if self.sampler is None:
+      return True, None
+    sample_rate = self.sampler.sample(_route_key(request), response.status, time)
+    return sample_rate is not None, sample_rate
+
   def log(
     self,
     request: BaseRequest,
     response: StreamResponse,
     time: float,
   ) -> None:
+    keep, sample_rate = self._sample(request, response, time)
+    if not keep:
+      return
+
+    self.logger.info(
+      compact_json(
+        _access_log_record(
+          request.method,
+          request.url.path,
+          response.status,
+          str(request.url),
+          time,
+          time_ns(),
+          get_request_id(request),
+          get_trace_id(request),
+          sample_rate,
+        )
+      )
+    )
+
+
+class AccessLogEntry(NamedTuple):
+  """
+  Everything the access log line needs, captured on the event loop without doing any
+  formatting
+  """
+
+  method: str
+  scheme: str
+  host: str
+  rel_url: URL
+  status: int
+  duration: float
+  time_ns: int
+  request_id: str
+  trace_id: str
+  sample_rate: Optional[float] = None
+
+  def to_json(self) -> str:
+    return compact_json(
+      _access_log_record(
+        self.method,
+        self.rel_url.path,
+        self.status,
+        f'{self.scheme}://{self.host}{self.rel_url}',
+        self.duration,
+        self.time_ns,
+        self.request_id,
+        self.trace_id,
+        self.sample_rate,
+      )
+    )
+
+
+class AccessLogWriter:
+  """
+  Formats and writes access log lines on a background thread. Entries are put on a
+  bounded queue and written out in batches, one stream write per batch, so a slow
+  stdout doesn't hold up the event loop.
+
+  When the queue is full, overflow='drop' discards the entry and counts it in
+  self.dropped, while overflow='block' blocks the caller (and so the event loop) until
+  there is room.
+
+  The thread is started on first use in each process, so a writer can be created before
+  the server forks its workers.
+  """
+
+  def __init__(
+    self,
+    stream: Optional[TextIO] = None,
+    max_queue: int = 10_000,
+    batch_size: int = 512,
+    overflow: Literal['drop', 'block'] = 'drop',
+  ):
+    self.stream = stream
+    self.max_queue = max_queue
+    self.batch_size = batch_size
+    self.overflow = overflow
+    self.dropped = 0
+    self.write_errors = 0
+    self._queue: queue.Queue[AccessLogEntry | threading.Event] = queue.Queue(max_queue)
+    self._lock = threading.Lock()
+    self._pid: Optional[int] = None
+
+  def _ensure_started(self) -> None:
+    if self._pid == os.getpid():
+      return
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      # After a fork the queue may hold the parent's entries and its thread is gone
+      self._queue = queue.Queue(self.max_queue)
+      self.dropped = 0
+      threading.Thread(target=self._run, name='alxhttp-access-log', daemon=True).start()
+      self._pid = os.getpid()
+
+  def submit(self, entry: AccessLogEntry) -> None:
+    self._ensure_started()
+    if self.overflow == 'block':
+      self._queue.put(entry)
+      return
+    try:
+      self._queue.put_nowait(entry)
+    except queue.Full:
+      self.dropped += 1
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
     """
-    Taking some naming conventions from:
-    https://github.com/opentracing/specification/blob/master/semantic_conventions.md
+    Wait until everything submitted so far has been written. Returns False on timeout.
     """
+    if self._pid != os.getpid():
+      return True
+    done = threading.Event()
+    try:
+      self._queue.put(done, timeout=timeout)
+    except queue.Full:
+      return False
+    return done.wait(timeout)
 
-    request_id = get_request_id(request)
-    trace_id = get_trace_id(request)
+  def _run(self) -> None:
+    q = self._queue
+    while True:
+      batch = [q.get()]
+      try:
+        while len(batch) < self.batch_size:
+          batch.append(q.get_nowait())
+      except queue.Empty:
+        pass
 
-    self.logger.info(
-      compact_json(
-        {
-          'message': f'{request.method} {request.url.path} {response.status}',
-          'duration': round(time, 8),
-          'time_ns': time_ns(),
-          'http': {
-            'method': request.method,
-            'status_code': response.status,
-            'url': str(request.url),
-          },
-          'component': 'aiohttp',
-          'request_id': request_id,
-          'traceId': trace_id,
-        }
+      lines: List[str] = []
+      flushed: List[threading.Event] = []
+      for item in batch:
+        if isinstance(item, threading.Event):
+          flushed.append(item)
+        else:
+          lines.append(item.to_json())
+
+      if lines:
+        stream = self.stream or sys.stdout
+        try:
+          lines.append('')
+          stream.write('\n'.join(lines))
+          stream.flush()
+        except Exception:
+          self.write_errors += 1
+
+      for done in flushed:
+        done.set()
+
+
+class QueuedJSONAccessLogger(JSONAccessLogger):
+  """
+  Writes the same lines as JSONAccessLogger, but only captures an AccessLogEntry on
+  the event loop and leaves the rest to an AccessLogWriter. Subclass and set writer to
+  change where lines go or how overflow is handled.
+
+  aiohttp's logger level still gates whether anything is logged at all.
+  """
+
+  writer: ClassVar[AccessLogWriter] = AccessLogWriter()
+
+  @property
+  def enabled(self) -> bool:
+    return self.logger.isEnabledFor(logging.INFO)
+
+  def log(
+    self,
+    request: BaseRequest,
+    response: StreamResponse,
+    time: float,
+  ) -> None:
+    keep, sample_rate = self._sample(request, response, time)
+    if not keep:
+      return
+
+    self.writer.submit(
+      AccessLogEntry(
+        request.method,
+        request.scheme,
+        request.host,
+        request.rel_url,
+        response.status,
+        time,
+        time_ns(),
+        get_request_id(request),
+        get_trace_id(request),
+        sample_rate,
       )
     )
 
 
 class JSONLogFilter(logging.Filter):
+  """
+  Tags records with the current request's ids and, unless rewrite_msg is off, rewrites
+  record.msg into a line of JSON. Turn rewrite_msg off when the records are emitted by a
+  handler using JSONFormatter, which builds the line only for records actually emitted.
+  """
+
+  def __init__(self, rewrite_msg: bool = True):
+    super().__init__()
+    self.rewrite_msg = rewrite_msg
+
   def filter(self, record: logging.LogRecord) -> bool:
-    request = get_request()
-    request_id = get_request_id(request) if request else None
-    trace_id = get_trace_id(request) if request else None
+    request_id, trace_id = current_log_context.get()
+    if request_id is None:
+      # Set by anything that only sets current_request
+      request = current_request.get(None)
+      if request is not None:
+        request_id, trace_id = get_request_id(request), get_trace_id(request)
+    record.request_id, record.traceId = request_id, trace_id
+
+    if self.rewrite_msg:
+      log_record = {
+        'time_ns': time_ns(),
+        'request_id': request_id,
+        'traceId': trace_id,
+      }
 
-    log_record = {
-      'time_ns': time_ns(),
+      if isinstance(record.msg, dict):
+        log_record = {**log_record, **record.msg}
+      else:
+        log_record['message'] = record.msg
+
+      record.msg = compact_json(log_record)
+
+    return True
+
+
+class JSONFormatter(logging.Formatter):
+  """
+  Formats a record as one line of JSON. Dict messages are merged into the line, anything
+  else becomes its message field.
+  """
+
+  def format(self, record: logging.LogRecord) -> str:
+    try:
+      request_id = record.request_id  # type: ignore
+      trace_id = record.traceId  # type: ignore
+    except AttributeError:
+      request_id, trace_id = current_log_context.get()
+
+    log_record: Dict[str, Any] = {
+      'time_ns': int(record.created * 1e9),
       'request_id': request_id,
       'traceId': trace_id,
     }
 
     if isinstance(record.msg, dict):
-      log_record = {**log_record, **record.msg}
+      log_record.update(record.msg)
     else:
-      log_record['message'] = record.msg
+      log_record['message'] = record.getMessage()
 
-    record.msg = compact_json(log_record)
+    if record.exc_info:
+      if not record.exc_text:
+        record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      log_record['exc_info'] = record.exc_text
+    if record.stack_info:
+      log_record['stack_info'] = self.formatStack(record.stack_info)
+
+    return compact_json(log_record)
 
-    return True
 
+def get_json_server_logger(json_handler: bool = False) -> logging.Logger:
+  """
+  The aiohttp.web logger, with its messages turned into JSON. Safe to call more than
+  once.
 
-def get_json_server_logger() -> logging.Logger:
+  With json_handler, the JSON is instead built by a stderr handler using JSONFormatter,
+  added once. The logger still propagates to the root logger's handlers unless the app
+  turns that off.
+  """
   logger = logging.getLogger('aiohttp.web')
-  logger.addFilter(JSONLogFilter())
+  json_filter = next((f for f in logger.filters if isinstance(f, JSONLogFilter)), None)
+  if json_filter is None:
+    json_filter = JSONLogFilter()
+    logger.addFilter(json_filter)
+  if json_handler:
+    json_filter.rewrite_msg = False
+    if not any(isinstance(h.formatter, JSONFormatter) for h in logger.handlers):
+      handler = logging.StreamHandler()
+      handler.setFormatter(JSONFormatter())
+      logger.addHandler(handler)
 
   return logger
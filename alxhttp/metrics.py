@@ -0,0 +1,194 @@
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from aiohttp.typedefs import Handler, Middleware
+from aiohttp.web import HTTPException, Request, StreamResponse, middleware
+from aiohttp.web_urldispatcher import AbstractRoute
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+# Requests that didn't match a route share one label so raw paths can't blow up the
+# number of series
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class RouteMetrics:
+  """
+  Raw counters for one method + route template. Histogram buckets are stored as
+  per-bucket counts (the last one being +Inf) and only made cumulative when rendered.
+  """
+
+  __slots__ = ('in_flight', 'statuses', 'latency_buckets', 'latency_counts', 'latency_sum', 'size_buckets', 'size_counts', 'size_sum')
+
+  def __init__(self, latency_buckets: Sequence[float], size_buckets: Sequence[int]):
+    self.in_flight = 0
+    self.statuses: Dict[int, int] = {}
+    self.latency_buckets = latency_buckets
+    self.latency_counts = [0] * (len(latency_buckets) + 1)
+    self.latency_sum = 0.0
+    self.size_buckets = size_buckets
+    self.size_counts = [0] * (len(size_buckets) + 1)
+    self.size_sum = 0
+
+  def observe(self, status: int, duration: float, size: Optional[int]) -> None:
+    """
+    size is None when the body's length isn't known, which leaves it out of the size
+    histogram
+    """
+    self.statuses[status] = self.statuses.get(status, 0) + 1
+    self.latency_counts[bisect_left(self.latency_buckets, duration)] += 1
+    self.latency_sum += duration
+    if size is not None:
+      self.size_counts[bisect_left(self.size_buckets, size)] += 1
+      self.size_sum += size
+
+
+def _escape(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name: str, labels: str, buckets: Sequence[float], counts: List[int], total: float) -> List[str]:
+  lines = []
+  cumulative = 0
+  for le, count in zip([*(repr(b) for b in buckets), '+Inf'], counts):
+    cumulative += count
+    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+  lines.append(f'{name}_sum{{{labels}}} {total}')
+  lines.append(f'{name}_count{{{labels}}} {cumulative}')
+  return lines
+
+
+class MetricsRegistry:
+  """
+  Per-route request metrics for one process. Recording is a handful of plain int/float
+  updates with no locking, so a registry must only be updated from the event loop
+  serving the app. With pre-forked workers each worker has its own registry, and
+  /metrics reports the worker that answered the scrape.
+  """
+
+  def __init__(
+    self,
+    namespace: str = 'alxhttp',
+    latency_buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    size_buckets: Sequence[int] = DEFAULT_SIZE_BUCKETS,
+  ):
+    self.namespace = namespace
+    self.latency_buckets = tuple(sorted(latency_buckets))
+    self.size_buckets = tuple(sorted(size_buckets))
+    self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+    # The same RouteMetrics keyed by aiohttp's route object, so the middleware's lookup
+    # is a single identity-hashed dict get
+    self._by_route: Dict[AbstractRoute, RouteMetrics] = {}
+
+  def for_request(self, request: Request) -> RouteMetrics:
+    route = request.match_info.route
+    m = self._by_route.get(route)
+    if m is not None:
+      return m
+    resource = route.resource
+    if resource is None:
+      # Not found / method not allowed get a fresh route object per request
+      return self.route(request.method, UNMATCHED_ROUTE)
+    m = self.route(request.method, resource.canonical)
+    if route.method == request.method:
+      # i.e. not a '*' route, which can't be cached by route alone
+      self._by_route[route] = m
+    return m
+
+  def route(self, method: str, route: str) -> RouteMetrics:
+    key = (method, route)
+    m = self.routes.get(key)
+    if m is None:
+      m = self.routes[key] = RouteMetrics(self.latency_buckets, self.size_buckets)
+    return m
+
+  def render(self) -> str:
+    """
+    The Prometheus text exposition format (version 0.0.4)
+    """
+    ns = self.namespace
+    routes = sorted(self.routes.items())
+    lines = [
+      f'# HELP {ns}_requests_total Requests handled, by route template and status.',
+      f'# TYPE {ns}_requests_total counter',
+    ]
+    labels = {key: f'method="{_escape(key[0])}",route="{_escape(key[1])}"' for key, _ in routes}
+    for key, m in routes:
+      for status, count in sorted(m.statuses.items()):
+        lines.append(f'{ns}_requests_total{{{labels[key]},status="{status}"}} {count}')
+
+    lines += [
+      f'# HELP {ns}_requests_in_flight Requests currently being handled.',
+      f'# TYPE {ns}_requests_in_flight gauge',
+    ]
+    for key, m in routes:
+      lines.append(f'{ns}_requests_in_flight{{{labels[key]}}} {m.in_flight}')
+
+    lines += [
+      f'# HELP {ns}_request_duration_seconds Time spent handling requests.',
+      f'# TYPE {ns}_request_duration_seconds histogram',
+    ]
+    for key, m in routes:
+      lines += _histogram_lines(f'{ns}_request_duration_seconds', labels[key], m.latency_buckets, m.latency_counts, m.latency_sum)
+
+    lines += [
+      f'# HELP {ns}_response_size_bytes Size of response bodies, where known up front.',
+      f'# TYPE {ns}_response_size_bytes histogram',
+    ]
+    for key, m in routes:
+      lines += _histogram_lines(f'{ns}_response_size_bytes', labels[key], m.size_buckets, m.size_counts, m.size_sum)
+
+    return '\n'.join(lines) + '\n'
+
+  async def handler(self, request: Request) -> web.Response:
+    return web.Response(text=self.render(), content_type='text/plain', charset='utf-8', headers={'x-prometheus-format': '0.0.4'})
+
+  def add_endpoint(self, router: web.UrlDispatcher, path: str = '/metrics') -> None:
+    router.add_get(path, self.handler)
+
+
+def _response_size(resp: StreamResponse) -> Optional[int]:
+  """
+  The body's length, or None if it isn't known when the handler returns (streamed
+  responses and FileResponse, unless they set Content-Length)
+  """
+  if isinstance(resp, web.Response):
+    body = resp.body
+    if isinstance(body, bytes):
+      return len(body)
+    if body is None:
+      return 0
+  return resp.content_length
+
+
+def metrics_middleware(registry: MetricsRegistry) -> Middleware:
+  """
+  Records every request into registry, keyed by method and route template (e.g.
+  /api/orgs/{org_id}) rather than by path. Put it first in the middleware list so the
+  statuses match what clients see.
+  """
+
+  @middleware
+  async def _metrics(request: Request, handler: Handler) -> StreamResponse:
+    m = registry.for_request(request)
+    m.in_flight += 1
+    start = perf_counter()
+    status = 500
+    size = None
+    try:
+      resp = await handler(request)
+      status = resp.status
+      size = _response_size(resp)
+      return resp
+    except HTTPException as e:
+      status = e.status
+      size = _response_size(e)
+      raise
+    finally:
+      m.in_flight -= 1
+      m.observe(status, perf_counter() - start, size)
+
+  return _metrics
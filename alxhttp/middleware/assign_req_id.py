@@ -1,14 +1,16 @@
 from aiohttp.typedefs import Handler
 from aiohttp.web import Request, StreamResponse, middleware
 
-from alxhttp.req_id import current_request, set_request_id
+from alxhttp.req_id import current_log_context, current_request, get_request_id, get_trace_id, set_request_id
 
 
 @middleware
 async def assign_req_id(request: Request, handler: Handler) -> StreamResponse:
   set_request_id(request)
   token = current_request.set(request)
+  log_token = current_log_context.set((get_request_id(request), get_trace_id(request)))
   try:
     return await handler(request)
   finally:
+    current_log_context.reset(log_token)
     current_request.reset(token)
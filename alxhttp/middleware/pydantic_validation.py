@@ -2,7 +2,13 @@ import pydantic
 from aiohttp.typedefs import Handler
 from aiohttp.web import Request, StreamResponse, middleware
 
-from alxhttp.pydantic.basemodel import PydanticErrorDetails, PydanticValidationError, fix_loc_list
+from alxhttp.pydantic.basemodel import ErrorModelException, PydanticErrorDetails, PydanticValidationError, fix_loc_list
+
+
+def pydantic_validation_exception(ve: pydantic.ValidationError) -> ErrorModelException:
+  return PydanticValidationError(
+    errors=[PydanticErrorDetails(type=x['type'], loc=fix_loc_list(x['loc']), msg=x['msg'], input=str(x['input']), ctx=x.get('ctx')) for x in ve.errors(include_url=False)]
+  ).exception()
 
 
 @middleware
@@ -14,6 +20,4 @@ async def pydantic_validation(request: Request, handler: Handler) -> StreamRespo
   try:
     return await handler(request)
   except pydantic.ValidationError as ve:
-    raise PydanticValidationError(
-      errors=[PydanticErrorDetails(type=x['type'], loc=fix_loc_list(x['loc']), msg=x['msg'], input=str(x['input']), ctx=x.get('ctx')) for x in ve.errors(include_url=False)]
-    ).exception() from ve
+    raise pydantic_validation_exception(ve) from ve
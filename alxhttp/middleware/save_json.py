@@ -1,13 +1,21 @@
+import asyncio
+import gzip
+import io
 import json
 import os
+import queue
+import random
+import threading
 from datetime import datetime, timezone
+from typing import IO, Any, Dict, List, Optional
 
-from aiohttp.typedefs import Handler
+from aiohttp import web
+from aiohttp.typedefs import Handler, Middleware
 from aiohttp.web import Request, Response, StreamResponse, middleware
 from aiohttp.web_exceptions import HTTPException
 
 from alxhttp.json import json_default
-from alxhttp.req_id import get_request_id
+from alxhttp.req_id import get_request_id, new_request_id
 
 
 @middleware
@@ -17,7 +25,8 @@ async def save_json(request: Request, handler: Handler) -> StreamResponse:
   """
   ts = int(datetime.now(tz=timezone.utc).timestamp())
 
-  req_id = get_request_id(request)
+  # Without assign_req_id every request would share the same file names
+  req_id = get_request_id(request) or new_request_id()
   body = None
   try:
     body = await request.text()
@@ -101,4 +110,251 @@ async def save_json(request: Request, handler: Handler) -> StreamResponse:
       )
 
   return resp
-  return resp
+
+
+def _decode_body(body: Optional[bytes]) -> Dict[str, Any]:
+  if not body:
+    return {'body': None}
+  try:
+    return {'body': json.loads(body)}
+  except ValueError:
+    return {'body_text': body.decode(errors='replace')}
+
+
+class _CloseSegment(threading.Event):
+  pass
+
+
+class JSONRecorder:
+  """
+  Records request/response pairs as JSON lines without blocking the event loop. The
+  record_json middleware captures the raw pieces of each sampled request and queues
+  them; a worker thread decodes the bodies, serializes each pair to one line and
+  appends it to the current segment file in directory. Segments are rotated once
+  max_segment_bytes (uncompressed) have been written, and gzipped when compress is set.
+
+  Pairs are dropped (and counted in self.dropped) rather than queued once the bodies
+  waiting to be written add up to more than max_queue_bytes.
+
+  Call close() or add on_cleanup to the app's on_cleanup so queued pairs are written
+  and the last segment is closed (a gzipped segment can't be read without its trailer)
+  on shutdown.
+  """
+
+  # Rough size of everything but the bodies, for the memory cap
+  _record_overhead = 1024
+
+  def __init__(
+    self,
+    directory: str = 'output',
+    sample_rate: float = 1.0,
+    max_segment_bytes: int = 64 * 1024 * 1024,
+    compress: bool = False,
+    max_queue_bytes: int = 16 * 1024 * 1024,
+  ):
+    self.directory = directory
+    self.sample_rate = sample_rate
+    self.max_segment_bytes = max_segment_bytes
+    self.compress = compress
+    self.max_queue_bytes = max_queue_bytes
+    self.recorded = 0
+    self.dropped = 0
+    self.write_errors = 0
+    self.segments: List[str] = []
+    self._queued_bytes = 0
+    self._queue: queue.SimpleQueue[Dict[str, Any] | threading.Event] = queue.SimpleQueue()
+    self._lock = threading.Lock()
+    self._pid: Optional[int] = None
+    # The segment being written, and the file under it when it's gzipped
+    self._file: Optional[IO[bytes]] = None
+    self._raw: Optional[io.FileIO] = None
+    self._file_bytes = 0
+
+  def sampled(self) -> bool:
+    return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+  def _ensure_started(self) -> None:
+    if self._pid == os.getpid():
+      return
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      # After a fork the parent's worker thread is gone and its open segment isn't ours
+      self._queue = queue.SimpleQueue()
+      self._queued_bytes = 0
+      self._detach_segment()
+      self.segments = []
+      threading.Thread(target=self._run, name='alxhttp-json-recorder', daemon=True).start()
+      self._pid = os.getpid()
+
+  def submit(self, record: Dict[str, Any], size: int) -> None:
+    self._ensure_started()
+    size += self._record_overhead
+    with self._lock:
+      if self._queued_bytes + size > self.max_queue_bytes:
+        self.dropped += 1
+        return
+      self._queued_bytes += size
+    record['_size'] = size
+    self._queue.put(record)
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
+    """
+    Wait until everything submitted so far is written out. Returns False on timeout.
+    """
+    if self._pid != os.getpid():
+      return True
+    done = threading.Event()
+    self._queue.put(done)
+    return done.wait(timeout)
+
+  def close(self, timeout: Optional[float] = None) -> bool:
+    """
+    flush, then close the current segment. Anything submitted later starts a new one.
+    """
+    if self._pid != os.getpid():
+      return True
+    done = _CloseSegment()
+    self._queue.put(done)
+    return done.wait(timeout)
+
+  async def on_cleanup(self, app: web.Application) -> None:
+    await asyncio.to_thread(self.close, 10.0)
+
+  def _open_segment(self) -> IO[bytes]:
+    os.makedirs(self.directory, exist_ok=True)
+    ts = int(datetime.now(tz=timezone.utc).timestamp())
+    path = os.path.join(self.directory, f'{ts}_{os.getpid()}_{len(self.segments)}.jsonl')
+    if self.compress:
+      path += '.gz'
+    # Unbuffered, each batch is a single write
+    self._raw = io.FileIO(path, mode='x')
+    self._file = gzip.GzipFile(fileobj=self._raw, mode='wb') if self.compress else self._raw
+    self.segments.append(path)
+    self._file_bytes = 0
+    return self._file
+
+  def _close_segment(self) -> None:
+    try:
+      if self._file is not None:
+        self._file.close()
+    finally:
+      if self._raw is not None:
+        self._raw.close()
+      self._file = None
+      self._raw = None
+
+  def _detach_segment(self) -> None:
+    """
+    Let go of a segment inherited from the parent process without writing to it, a
+    gzip trailer from here would corrupt the parent's file
+    """
+    if isinstance(self._file, gzip.GzipFile):
+      self._file.fileobj = None  # type: ignore
+    if self._raw is not None:
+      self._raw.close()
+    self._file = None
+    self._raw = None
+
+  def _write(self, lines: List[str]) -> None:
+    f = self._file if self._file is not None else self._open_segment()
+    data = ('\n'.join(lines) + '\n').encode()
+    f.write(data)
+    self._file_bytes += len(data)
+    if self._file_bytes >= self.max_segment_bytes:
+      self._close_segment()
+
+  def _run(self) -> None:
+    q = self._queue
+    while True:
+      item = q.get()
+      lines: List[str] = []
+      flushed: List[threading.Event] = []
+      while True:
+        if isinstance(item, threading.Event):
+          flushed.append(item)
+        else:
+          size = item.pop('_size')
+          lines.append(self._serialize(item))
+          with self._lock:
+            self._queued_bytes -= size
+        try:
+          item = q.get_nowait()
+        except queue.Empty:
+          break
+
+      try:
+        if lines:
+          self._write(lines)
+          self.recorded += len(lines)
+        if self._file is not None:
+          if any(isinstance(done, _CloseSegment) for done in flushed):
+            self._close_segment()
+          else:
+            self._file.flush()
+      except OSError:
+        self.write_errors += len(lines)
+        try:
+          self._close_segment()
+        except OSError:
+          pass
+      for done in flushed:
+        done.set()
+
+  def _serialize(self, record: Dict[str, Any]) -> str:
+    record |= _decode_body(record.pop('body'))
+    resp = record['response']
+    if resp is not None:
+      resp |= _decode_body(resp.pop('body'))
+    return json.dumps(record, sort_keys=True, ensure_ascii=True, default=json_default)
+
+
+def record_json(recorder: JSONRecorder) -> Middleware:
+  """
+  Like save_json, but hands the request/response pairs to a JSONRecorder
+  """
+
+  @middleware
+  async def _record_json(request: Request, handler: Handler) -> StreamResponse:
+    if not recorder.sampled():
+      return await handler(request)
+
+    req_body = await request.read()
+    record: Dict[str, Any] = {
+      'req_id': get_request_id(request),
+      'ts': datetime.now(tz=timezone.utc).timestamp(),
+      'method': request.method,
+      'url': str(request.url),
+      'path_qs': request.path_qs,
+      'route': request.match_info.route.resource.canonical if request.match_info.route.resource else None,
+      'match_info': dict(request.match_info),
+      'headers': dict(request.headers),
+      'cookies': dict(request.cookies),
+      'query': dict(request.query),
+      'body': req_body,
+      'response': None,
+    }
+
+    resp_body: Optional[bytes] = None
+    try:
+      resp = await handler(request)
+    except HTTPException as e:
+      resp_body = e.body if isinstance(e.body, bytes) else None
+      record['response'] = {'status': e.status, 'headers': dict(e.headers), 'body': resp_body}
+      recorder.submit(record, len(req_body) + len(resp_body or b''))
+      raise
+
+    if isinstance(resp, Response):
+      resp_body = resp.body if isinstance(resp.body, bytes) else None
+      record['response'] = {
+        'status': resp.status,
+        'headers': dict(resp.headers),
+        'cookies': {k: v.value for k, v in resp.cookies.items()},
+        'body': resp_body,
+      }
+    else:
+      record['response'] = {'status': resp.status, 'headers': dict(resp.headers), 'body': None}
+    recorder.submit(record, len(req_body) + len(resp_body or b''))
+    return resp
+
+  return _record_json
@@ -9,6 +9,29 @@ from alxhttp.json import json_error_response
 from alxhttp.req_id import get_request_id
 
 
+def unhandled_error_response(request: Request, e: Exception) -> StreamResponse:
+  """
+  Log an exception the handler didn't deal with and turn it into a JSON 500. Must be
+  called from inside the except block.
+  """
+  exc = sys.exception()
+  request.app.logger.error(
+    {
+      'request_id': get_request_id(request),
+      'message': 'Unhandled Exception',
+      'error': {'kind': e.__class__.__name__},
+      'stack': repr(traceback.format_tb(exc.__traceback__)) if exc else '',
+    }
+  )
+
+  # Be nice when debugging and dump the exception pretty-printed to the console
+  loop = asyncio.get_running_loop()
+  if loop.get_debug():
+    request.app.logger.exception('Unhandled Exception')
+
+  return json_error_response(request, 'Unhandled Exception', 500)
+
+
 @middleware
 async def unhandled_errors(request: Request, handler: Handler) -> StreamResponse:
   try:
@@ -16,19 +39,4 @@ async def unhandled_errors(request: Request, handler: Handler) -> StreamResponse
   except HTTPException:
     raise
   except Exception as e:
-    exc = sys.exception()
-    request.app.logger.error(
-      {
-        'request_id': get_request_id(request),
-        'message': 'Unhandled Exception',
-        'error': {'kind': e.__class__.__name__},
-        'stack': repr(traceback.format_tb(exc.__traceback__)) if exc else '',
-      }
-    )
-
-    # Be nice when debugging and dump the exception pretty-printed to the console
-    loop = asyncio.get_running_loop()
-    if loop.get_debug():
-      request.app.logger.exception('Unhandled Exception')
-
-    return json_error_response(request, 'Unhandled Exception', 500)
+    return unhandled_error_response(request, e)
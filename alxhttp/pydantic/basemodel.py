@@ -1,65 +1,154 @@
 import json
 import typing
 from datetime import datetime
-from typing import Annotated, Any, Dict, List, Optional, Tuple, Type, TypeVar, get_type_hints
+from functools import partial
+from typing import Annotated, Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar, get_type_hints
 
 import asyncpg
 import pydantic
 from aiohttp.web import HTTPError, HTTPNotFound, HTTPSuccessful
+from pydantic_core import core_schema
 
 from alxhttp.req_id import get_request, get_request_id
 from alxhttp.typescript.type_checks import is_dict, is_list, is_model_type, is_optional, is_union_of_models
 from alxhttp.typescript.types import TSEnum
 
+JSONLoader = Callable[[Any], Any]
 
-def recursive_json_loads(type, data):
+
+def _identity_loader(data: Any) -> Any:
+  return data
+
+
+_json_loaders: Dict[Any, JSONLoader] = {}
+
+
+def compile_json_loader(type) -> JSONLoader:
   """
-  json loads anything that requires recursive model verification
+  Build (once per type) a function that json loads anything that requires recursive
+  model verification. Types that can never hold JSON text compile to _identity_loader
+  so callers can skip them entirely.
   """
+  try:
+    loader = _json_loaders.get(type)
+  except TypeError:
+    # unhashable annotation, don't cache it
+    return _compile_json_loader(type)
+  return loader or _compile_json_loader(type)
 
+
+def _compile_json_loader(type) -> JSONLoader:
   # Unwrap optionals
   if is_optional(type):
+    loader = compile_json_loader(typing.get_args(type)[0])
+  elif is_union_of_models(type):
+    loader = _load_union_of_models
+  elif is_model_type(type):
+    # Registered before the fields are compiled so self-referencing models terminate
+    fields: List[Tuple[str, JSONLoader]] = []
+    loader = partial(_load_model, fields)
+    cached = set(_json_loaders)
+    _json_loaders[type] = loader
+    try:
+      for k, t in get_type_hints(type).items():
+        field_loader = compile_json_loader(t)
+        if field_loader is not _identity_loader:
+          fields.append((k, field_loader))
+    except BaseException:
+      # Don't leave behind a loader that's missing fields, or anything compiled against it
+      for k in set(_json_loaders) - cached:
+        del _json_loaders[k]
+      raise
+    return loader
+  elif is_dict(type):
     targs = typing.get_args(type)
-    return recursive_json_loads(targs[0], data)
-
-  if is_union_of_models(type):
-    # TODO: stronger checking on the union models
-    if isinstance(data, str):
-      return json.loads(data)
-    elif isinstance(data, dict):
-      return data
-    else:
-      assert False
-
-  if isinstance(data, str) and (is_dict(type) or is_list(type) or is_model_type(type)):
-    return recursive_json_loads(type, json.loads(data))
-
+    loader = partial(_load_dict, compile_json_loader(targs[1]) if targs else _identity_loader)
+  elif is_list(type):
+    targs = typing.get_args(type)
+    loader = partial(_load_list, compile_json_loader(targs[0]) if targs else _identity_loader)
+  else:
+    loader = _identity_loader
+
+  try:
+    _json_loaders[type] = loader
+  except TypeError:
+    pass
+  return loader
+
+
+def _load_union_of_models(data: Any) -> Any:
+  # TODO: stronger checking on the union models
+  if isinstance(data, str):
+    return json.loads(data)
+  elif isinstance(data, dict):
+    return data
+  else:
+    assert False
+
+
+def _load_model(fields: List[Tuple[str, JSONLoader]], data: Any) -> Any:
+  if isinstance(data, str):
+    data = json.loads(data)
   if isinstance(data, dict):
-    assert is_dict(type) or is_model_type(type)
+    for k, loader in fields:
+      if k in data:
+        data[k] = loader(data[k])
+  return data
 
+
+def _load_dict(value_loader: JSONLoader, data: Any) -> Any:
+  if isinstance(data, str):
+    data = json.loads(data)
+  if isinstance(data, dict) and value_loader is not _identity_loader:
     for k, v in data.items():
-      if is_model_type(type):
-        t = get_type_hints(type).get(k)
-      else:
-        assert is_dict(type)
-        t = typing.get_args(type)[1]
-
-      # likely a mistake with the model/record that will be caught by pydantic
-      if not t:
-        continue
-
-      data[k] = recursive_json_loads(t, v)
-  elif isinstance(data, list):
-    assert is_list(type)
-    type = typing.get_args(type)[0]
-    data = [recursive_json_loads(type, d) for d in data]
+      data[k] = value_loader(v)
+  return data
 
+
+def _load_list(item_loader: JSONLoader, data: Any) -> Any:
+  if isinstance(data, str):
+    data = json.loads(data)
+  if isinstance(data, list) and item_loader is not _identity_loader:
+    data = [item_loader(d) for d in data]
   return data
 
 
+def recursive_json_loads(type, data):
+  """
+  json loads anything that requires recursive model verification
+  """
+  return compile_json_loader(type)(data)
+
+
 BaseModelType = TypeVar('BaseModelType', bound='BaseModel')
 
 
+def datetime_as_timestamp(value: datetime) -> float:
+  return value.timestamp()
+
+
+_datetime_as_timestamp_ser = core_schema.plain_serializer_function_ser_schema(datetime_as_timestamp, return_schema=core_schema.float_schema())
+
+
+def _serialize_datetimes_as_timestamps(schema: Any, cls: type) -> None:
+  """
+  Give every datetime schema in cls's core schema (including inside lists, dicts,
+  optionals etc.) a serializer that writes it as a float timestamp, in python and json
+  mode. Other models' schemas are left alone, BaseModels do their own.
+  """
+  if isinstance(schema, dict):
+    if schema.get('type') == 'model' and schema.get('cls') is not cls:
+      return
+    if schema.get('type') == 'datetime' and 'serialization' not in schema:
+      schema['serialization'] = _datetime_as_timestamp_ser
+      return
+    for value in schema.values():
+      _serialize_datetimes_as_timestamps(value, cls)
+  elif isinstance(schema, list):
+    for value in schema:
+      _serialize_datetimes_as_timestamps(value, cls)
+
+
 class BaseModel(pydantic.BaseModel):
   """
   A Pydantic model with some opinions:
@@ -69,20 +158,19 @@ class BaseModel(pydantic.BaseModel):
 
   model_config = pydantic.ConfigDict(extra='forbid')
 
-  @pydantic.field_serializer('*', mode='wrap')
-  def datetimes_as_timestamps(self, value: Any, nxt: pydantic.SerializerFunctionWrapHandler) -> Any:
-    if isinstance(value, datetime):
-      return value.timestamp()
-    else:
-      return nxt(value)
+  @classmethod
+  def __get_pydantic_core_schema__(cls, source: Any, handler: pydantic.GetCoreSchemaHandler) -> core_schema.CoreSchema:
+    # The serializer goes on the datetime schemas only, rather than a wrap serializer
+    # calling back into python for every field
+    schema = handler(source)
+    _serialize_datetimes_as_timestamps(schema, cls)
+    return schema
 
   @classmethod
   def from_record(cls: Type[BaseModelType], record: asyncpg.Record | None) -> BaseModelType:
     if not record:
       raise HTTPNotFound()
-    record_dict = dict(record)
-    record_dict = recursive_json_loads(cls, record_dict)
-    return cls.model_validate(record_dict)
+    return cls.model_validate(compile_json_loader(cls)(dict(record)))
 
   def exception(self, status_code: int = 200):
     """
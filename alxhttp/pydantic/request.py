@@ -1,8 +1,11 @@
 import json
-from typing import Type, TypeVar
+import typing
+from typing import Any, Dict, List, Optional, Type, TypeVar
 
 import pydantic
+import pydantic_core
 from aiohttp import web
+from pydantic_core import InitErrorDetails, PydanticCustomError, SchemaValidator
 
 from alxhttp.pydantic.basemodel import BaseModel
 
@@ -11,6 +14,26 @@ MatchInfoType = TypeVar('MatchInfoType', bound=BaseModel)
 BodyType = TypeVar('BodyType', bound=BaseModel)
 QueryType = TypeVar('QueryType', bound=BaseModel)
 
+_known_error_types = frozenset(typing.get_args(pydantic_core.core_schema.ErrorType))
+
+
+def _prefix_errors(ve: pydantic.ValidationError, prefix: str) -> List[InitErrorDetails]:
+  """
+  Re-root the errors from validating one field of the Request so their locations match
+  what validating the whole Request would have produced
+  """
+  errors: List[InitErrorDetails] = []
+  for e in ve.errors(include_url=False):
+    loc = (prefix, *e['loc'])
+    if e['type'] in _known_error_types:
+      details: InitErrorDetails = {'type': e['type'], 'loc': loc, 'input': e['input']}  # type: ignore
+      if 'ctx' in e:
+        details['ctx'] = e['ctx']
+    else:
+      details = {'type': PydanticCustomError(e['type'], e['msg']), 'loc': loc, 'input': e['input']}
+    errors.append(details)
+  return errors
+
 
 class Request[MatchInfoType, BodyType, QueryType](BaseModel):
   _web_request: web.Request = pydantic.PrivateAttr()
@@ -20,10 +43,14 @@ class Request[MatchInfoType, BodyType, QueryType](BaseModel):
 
   @classmethod
   async def from_request(cls: Type[RequestType], request: web.Request) -> RequestType:
+    validators = _get_field_validators(cls)
+    if validators:
+      return await cls._from_request_bytes(request, validators)
+
     text = await request.text()
     body = json.loads(text) if text else {}
 
-    m = cls.model_validate(
+    m = cls.__pydantic_validator__.validate_python(
       {
         'match_info': request.match_info,
         'body': body,
@@ -32,3 +59,61 @@ class Request[MatchInfoType, BodyType, QueryType](BaseModel):
     )
     m._web_request = request
     return m
+
+  @classmethod
+  async def _from_request_bytes(cls: Type[RequestType], request: web.Request, validators: Dict[str, SchemaValidator]) -> RequestType:
+    """
+    Validate the body straight from the raw bytes with pydantic-core's JSON parser rather
+    than decoding to str, json.loads-ing to a dict and validating that.
+    """
+    raw = await request.read()
+    inputs = {
+      'match_info': request.match_info,
+      'query': dict(request.query),
+    }
+    fields: Dict[str, Any] = {}
+    errors: List[InitErrorDetails] = []
+    for name in ('match_info', 'body', 'query'):
+      validator = validators[name]
+      try:
+        if name != 'body':
+          fields[name] = validator.validate_python(inputs[name])
+        elif raw:
+          fields[name] = validator.validate_json(raw)
+        else:
+          fields[name] = validator.validate_python({})
+      except pydantic.ValidationError as ve:
+        errors += _prefix_errors(ve, name)
+
+    if errors:
+      raise pydantic.ValidationError.from_exception_data(cls.__name__, errors)
+
+    # The fields are already validated model instances, which pass straight through
+    m = cls.__pydantic_validator__.validate_python(fields)
+    m._web_request = request
+    return m
+
+
+_field_validators: Dict[type, Optional[Dict[str, SchemaValidator]]] = {}
+
+
+def _get_field_validators(cls: type) -> Optional[Dict[str, SchemaValidator]]:
+  """
+  The bytes fast path only applies to plain parametrizations of Request whose fields
+  are all models. Anything else (e.g. a subclass with its own validators) goes through
+  the dict path.
+  """
+  try:
+    return _field_validators[cls]
+  except KeyError:
+    pass
+
+  validators: Optional[Dict[str, SchemaValidator]] = None
+  metadata = getattr(cls, '__pydantic_generic_metadata__', None)
+  if metadata and metadata['origin'] is Request:
+    annotations = {name: cls.model_fields[name].annotation for name in ('match_info', 'body', 'query')}  # type: ignore
+    if all(isinstance(t, type) and issubclass(t, pydantic.BaseModel) for t in annotations.values()):
+      validators = {name: t.__pydantic_validator__ for name, t in annotations.items()}  # type: ignore
+
+  _field_validators[cls] = validators
+  return validators
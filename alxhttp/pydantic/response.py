@@ -1,5 +1,5 @@
 from concurrent.futures import Executor
-from typing import Optional, TypeVar
+from typing import AsyncIterable, List, Optional, TypeVar
 
 import pydantic
 from aiohttp import web
@@ -24,13 +24,13 @@ class Response[ResponseType](web.Response):
     zlib_executor: Optional[Executor] = None,
   ):
     super().__init__(
-      body=None,
+      # Serialize straight to bytes rather than to a str that aiohttp then encodes again
+      body=body.__pydantic_serializer__.to_json(body),  # type: ignore
       status=status,
       reason=reason,
-      text=body.model_dump_json(),  # type: ignore
       headers=headers,
       content_type=content_type,
-      charset=charset,
+      charset=charset or 'utf-8',
       zlib_executor_size=zlib_executor_size,
       zlib_executor=zlib_executor,
     )
@@ -39,3 +39,49 @@ class Response[ResponseType](web.Response):
 class EmptyResponse(Response[Empty]):
   def __init__(self):
     super().__init__(body=Empty())
+
+
+# Rows are buffered into chunks of roughly this many bytes before hitting the socket
+_stream_chunk_size = 64 * 1024
+
+
+async def stream_response(
+  request: web.Request,
+  models: AsyncIterable[pydantic.BaseModel],
+  *,
+  ndjson: bool = True,
+  status: int = 200,
+  headers: Optional[LooseHeaders] = None,
+) -> web.StreamResponse:
+  """
+  Write models to the client as they are produced (e.g. from SQLValidator.cursor) so
+  memory use stays flat regardless of the result size. Either one JSON document per
+  line (ndjson) or a single JSON array.
+  """
+  resp = web.StreamResponse(status=status, headers=headers)
+  resp.content_type = 'application/x-ndjson' if ndjson else 'application/json'
+  resp.charset = 'utf-8'
+  resp.enable_chunked_encoding()
+  await resp.prepare(request)
+
+  # ndjson terminates every document, arrays open with [ and separate with ,
+  sep, end = (b'', b'\n') if ndjson else (b'[', b'')
+  chunk: List[bytes] = []
+  chunk_size = 0
+
+  async for model in models:
+    data = model.__pydantic_serializer__.to_json(model)
+    chunk += (sep, data, end)
+    chunk_size += len(data)
+    sep = b'' if ndjson else b','
+    if chunk_size >= _stream_chunk_size:
+      await resp.write(b''.join(chunk))
+      chunk.clear()
+      chunk_size = 0
+
+  if not ndjson:
+    chunk.append(b'[]' if sep == b'[' else b']')
+  if chunk:
+    await resp.write(b''.join(chunk))
+  await resp.write_eof()
+  return resp
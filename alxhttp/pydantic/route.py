@@ -61,8 +61,11 @@ def route(
     if not new_ts_name:
       new_ts_name = humps.camelize(func.__name__)
 
+    # Parametrizing the generic is a surprisingly expensive cache lookup, so do it once here
+    request_cls = Request[match_info, body, query]
+
     async def wrapper(server: ServerType, request: web.Request, *args: Any, **kwargs: Any) -> Response[ResponseType]:
-      vr = await Request[match_info, body, query].from_request(request)
+      vr = await request_cls.from_request(request)
       return await func(server, vr, *args, **kwargs)
 
     setattr(wrapper, '_alxhttp_route_name', name)
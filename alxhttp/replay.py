@@ -0,0 +1,237 @@
+"""
+Replays traffic recorded by JSONRecorder (alxhttp.middleware.save_json) against a
+running server, or an in-process aiohttp test server, and reports latency percentiles,
+throughput and error rates per route as JSON.
+
+  python -m alxhttp.replay --url http://localhost:8080 --rps 200 --count 5000 output/*.jsonl
+  python -m alxhttp.replay --server example.server:ExampleServer --concurrency 16 output/*.jsonl
+"""
+
+import argparse
+import asyncio
+import gzip
+import importlib
+import json
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from itertools import cycle
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from yarl import URL
+
+# Headers that describe the original connection rather than the request
+_skip_headers = frozenset(['host', 'content-length', 'transfer-encoding', 'connection', 'keep-alive', 'accept-encoding'])
+
+
+@dataclass
+class RecordedRequest:
+  method: str
+  path_qs: str
+  route: str
+  headers: Dict[str, str]
+  body: Optional[bytes]
+
+
+def _open_recording(path: str) -> IO[str]:
+  if path.endswith('.gz'):
+    return gzip.open(path, mode='rt', encoding='utf-8')
+  return open(path, encoding='utf-8')
+
+
+def load_recorded_requests(paths: Iterable[str]) -> List[RecordedRequest]:
+  requests: List[RecordedRequest] = []
+  for path in paths:
+    with _open_recording(path) as f:
+      for line in f:
+        if not line.strip():
+          continue
+        record = json.loads(line)
+        if 'body_text' in record:
+          body: Optional[bytes] = record['body_text'].encode()
+        elif record.get('body') is not None:
+          body = json.dumps(record['body']).encode()
+        else:
+          body = None
+        requests.append(
+          RecordedRequest(
+            method=record['method'],
+            path_qs=record['path_qs'],
+            route=f'{record["method"]} {record.get("route") or URL(record["path_qs"]).path}',
+            headers={k: v for k, v in record.get('headers', {}).items() if k.lower() not in _skip_headers},
+            body=body,
+          )
+        )
+  return requests
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+  """
+  Nearest-rank percentile of an already sorted list
+  """
+  if not ordered:
+    return 0.0
+  return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class RouteStats:
+  latencies: List[float] = field(default_factory=list)
+  statuses: Dict[int, int] = field(default_factory=dict)
+  errors: int = 0
+
+  def report(self, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(self.latencies)
+    count = len(ordered)
+    return {
+      'count': count,
+      'throughput_rps': count / elapsed if elapsed else 0.0,
+      'errors': self.errors,
+      'error_rate': self.errors / count if count else 0.0,
+      'statuses': {str(k): v for k, v in sorted(self.statuses.items())},
+      'latency_ms': {
+        'mean': sum(ordered) / count * 1e3 if count else 0.0,
+        'p50': _percentile(ordered, 50) * 1e3,
+        'p95': _percentile(ordered, 95) * 1e3,
+        'p99': _percentile(ordered, 99) * 1e3,
+        'max': ordered[-1] * 1e3 if count else 0.0,
+      },
+    }
+
+
+class _ReplayStats:
+  def __init__(self):
+    self.routes: Dict[str, RouteStats] = {}
+    self.total = RouteStats()
+
+  def add(self, route: str, latency: float, status: Optional[int]) -> None:
+    route_stats = self.routes.get(route)
+    if route_stats is None:
+      route_stats = self.routes[route] = RouteStats()
+    for s in (route_stats, self.total):
+      s.latencies.append(latency)
+      if status is None or status >= 500:
+        s.errors += 1
+      if status is not None:
+        s.statuses[status] = s.statuses.get(status, 0) + 1
+
+  def report(self, elapsed: float, mode: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+      **mode,
+      'elapsed_s': elapsed,
+      **self.total.report(elapsed),
+      'routes': {route: stats.report(elapsed) for route, stats in sorted(self.routes.items())},
+    }
+
+
+async def _send(session: aiohttp.ClientSession, base_url: URL, req: RecordedRequest, stats: _ReplayStats, started: float) -> None:
+  """
+  started is when the request was due to be sent, so that a server falling behind a
+  fixed rate shows up in the latencies rather than just slowing the test down
+  """
+  status: Optional[int] = None
+  try:
+    async with session.request(req.method, base_url.join(URL(req.path_qs, encoded=True)), headers=req.headers, data=req.body) as resp:
+      await resp.read()
+      status = resp.status
+  except (aiohttp.ClientError, asyncio.TimeoutError):
+    pass
+  stats.add(req.route, time.perf_counter() - started, status)
+
+
+async def replay(
+  base_url: str | URL,
+  requests: List[RecordedRequest],
+  count: Optional[int] = None,
+  rps: Optional[float] = None,
+  concurrency: int = 10,
+) -> Dict[str, Any]:
+  """
+  Send count requests (by default each recorded request once, cycling through them if
+  count is larger) to base_url and return the report.
+
+  With rps set, requests are started on a fixed schedule regardless of how quickly
+  earlier ones complete (open loop). Otherwise concurrency requests are kept in flight
+  at all times (closed loop).
+  """
+  if not requests:
+    raise ValueError('No recorded requests to replay')
+  base_url = URL(base_url)
+  count = len(requests) if count is None else count
+  source: Iterator[RecordedRequest] = cycle(requests)
+  stats = _ReplayStats()
+
+  connector = aiohttp.TCPConnector(limit=0 if rps else concurrency)
+  async with aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar()) as session:
+    start = time.perf_counter()
+    if rps:
+      interval = 1.0 / rps
+      async with asyncio.TaskGroup() as tg:
+        for idx in range(count):
+          due = start + idx * interval
+          delay = due - time.perf_counter()
+          if delay > 0:
+            await asyncio.sleep(delay)
+          tg.create_task(_send(session, base_url, next(source), stats, due))
+      mode: Dict[str, Any] = {'mode': 'rps', 'target_rps': rps}
+    else:
+      remaining = count
+
+      async def worker():
+        nonlocal remaining
+        while remaining > 0:
+          remaining -= 1
+          await _send(session, base_url, next(source), stats, time.perf_counter())
+
+      async with asyncio.TaskGroup() as tg:
+        for _ in range(concurrency):
+          tg.create_task(worker())
+      mode = {'mode': 'concurrency', 'concurrency': concurrency}
+    elapsed = time.perf_counter() - start
+
+  return stats.report(elapsed, mode)
+
+
+async def replay_app(app: web.Application, requests: List[RecordedRequest], **kwargs) -> Dict[str, Any]:
+  """
+  Like replay, but against app served in-process by aiohttp's test server
+  """
+  async with TestServer(app) as server:
+    return await replay(server.make_url(''), requests, **kwargs)
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+  requests = load_recorded_requests(args.recordings)
+  kwargs = {'count': args.count, 'rps': args.rps, 'concurrency': args.concurrency}
+  if args.url:
+    return await replay(args.url, requests, **kwargs)
+
+  module_name, _, class_name = args.server.partition(':')
+  server_cls = getattr(importlib.import_module(module_name), class_name)
+  server = server_cls()
+  server.app.cleanup_ctx.append(server.setup_ctx)
+  return await replay_app(server.app, requests, **kwargs)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+  parser = argparse.ArgumentParser(prog='python -m alxhttp.replay', description='Replay recorded requests and report latencies as JSON')
+  target = parser.add_mutually_exclusive_group(required=True)
+  target.add_argument('--url', help='base url of a running server')
+  target.add_argument('--server', help='module:ServerClass to run in-process')
+  parser.add_argument('--rps', type=float, help='send at this fixed rate instead of at a fixed concurrency')
+  parser.add_argument('--concurrency', type=int, default=10)
+  parser.add_argument('--count', type=int, help='number of requests to send (default: each recorded request once)')
+  parser.add_argument('recordings', nargs='+', help='.jsonl or .jsonl.gz files written by JSONRecorder')
+  args = parser.parse_args(argv)
+
+  report = asyncio.run(_main(args))
+  json.dump(report, sys.stdout, indent=2)
+  sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+  main()
@@ -1,5 +1,6 @@
 import contextvars
 import random
+from typing import Optional, Tuple
 
 from aiohttp.web import BaseRequest
 
@@ -10,8 +11,12 @@ __trace_id_key = '__req_id_middleware_trace_id'
 
 current_request = contextvars.ContextVar('current_request')
 
+# (request_id, trace_id) of the current request, kept in one slot so tagging a log
+# record is a single contextvar read
+current_log_context: contextvars.ContextVar[Tuple[Optional[str], Optional[str]]] = contextvars.ContextVar('current_log_context', default=(None, None))
 
-def _req_id() -> str:
+
+def new_request_id() -> str:
   r = random.getrandbits(128)
   return f'{r:016x}'
 
@@ -32,5 +37,5 @@ def get_trace_id(request: BaseRequest) -> str:
 def set_request_id(request: BaseRequest) -> None:
   trace_id = get_xray_trace_id()
 
-  request[__req_id_key] = _req_id()
+  request[__req_id_key] = new_request_id()
   request[__trace_id_key] = trace_id
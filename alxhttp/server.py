@@ -1,30 +1,77 @@
 import asyncio
 import logging
-from typing import Awaitable, Callable, List, Optional, TypeVar
+import multiprocessing
+import signal
+import socket
+from dataclasses import dataclass
+from multiprocessing.process import BaseProcess
+from multiprocessing.synchronize import Event as ProcessEvent
+from time import monotonic
+from typing import Awaitable, Callable, List, Optional, Type, TypeVar
 
 from aiohttp import web
+from aiohttp.abc import AbstractAccessLogger
 from aiohttp.typedefs import Middleware
 from aiohttp.web_request import Request
 from aiohttp.web_response import StreamResponse
 
-from alxhttp.logging import JSONAccessLogger, get_json_server_logger
+from alxhttp.logging import JSONAccessLogger, QueuedJSONAccessLogger, get_json_server_logger
 from alxhttp.middleware.defaults import default_middleware
 
+# How often the supervisor checks on workers, and how long it waits for them to become
+# ready / shut down
+_worker_poll_interval = 0.5
+_worker_start_timeout = 30.0
+_worker_stop_timeout = 10.0
+# Workers that die before becoming ready are restarted with exponential backoff, up to
+_worker_max_backoff = 30.0
+
+
+@dataclass
+class _WorkerSlot:
+  idx: int
+  proc: BaseProcess
+  ready: ProcessEvent
+  started_at: float
+  # Consecutive times the worker died (or was killed) before becoming ready
+  failures: int = 0
+  restart_at: Optional[float] = None
+
+
+def _reuseport_socket(host: str, port: int) -> socket.socket:
+  """
+  Bind (but don't listen on) a TCP socket with SO_REUSEPORT so that several
+  processes can share the same host/port
+  """
+  family, type, proto, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)[0]
+  sock = socket.socket(family, type, proto)
+  try:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(addr)
+  except Exception:
+    sock.close()
+    raise
+  return sock
+
 
 class Server:
   def __init__(
     self,
     middlewares: Optional[List[Middleware]] = None,
     logger: Optional[logging.Logger] = None,
+    access_log_class: Type[AbstractAccessLogger] = JSONAccessLogger,
   ):
     if middlewares is None:
       middlewares = default_middleware()
     if logger is None:
       logger = get_json_server_logger()
     self.app = web.Application(middlewares=middlewares, logger=logger)
+    self.access_log_class = access_log_class
     self.host: str
     self.port: int
     self.shutdown_event = asyncio.Event()
+    self.workers: List[BaseProcess] = []
 
   async def setup_ctx(self, app: web.Application):
     """
@@ -33,10 +80,25 @@ class Server:
     """
     yield
 
-  async def run_app(self, log: logging.Logger, host: str = 'localhost', port: int = 0) -> None:
+  async def run_app(
+    self,
+    log: logging.Logger,
+    host: str = 'localhost',
+    port: int = 0,
+    workers: int = 1,
+    server_factory: Optional[Callable[[], 'Server']] = None,
+  ) -> None:
+    """
+    Serve the app until shutdown_event is set. With workers > 1 this process becomes a
+    supervisor that starts that many worker processes which all accept on the same port,
+    see _run_workers.
+    """
+    if workers > 1:
+      return await self._run_workers(log, host, port, workers, server_factory or type(self))
+
     self.app.cleanup_ctx.append(self.setup_ctx)
 
-    runner = web.AppRunner(self.app, debug=True, access_log_class=JSONAccessLogger)
+    runner = web.AppRunner(self.app, debug=True, access_log_class=self.access_log_class)
     await runner.setup()
     site = web.TCPSite(runner, host, port)
 
@@ -59,6 +121,135 @@ class Server:
       pass
     finally:
       await runner.cleanup()
+      await self._flush_access_log()
+
+  async def _run_workers(self, log: logging.Logger, host: str, port: int, num_workers: int, server_factory: Callable[[], 'Server']) -> None:
+    """
+    Multi-process supervisor. It holds a bound (not listening) SO_REUSEPORT socket
+    so the port stays reserved, and resolved when port=0, across worker restarts. Each
+    worker binds its own listening socket to that port and the kernel balances
+    connections between them.
+
+    This process already has an event loop running (and likely threads), so workers are
+    spawned rather than forked, and each builds its own server by calling server_factory
+    (type(self) by default). It must be picklable, i.e. importable by name, and is called
+    with no arguments, so nothing set on this instance carries over. Like anything using
+    spawn, each worker re-imports the main module, so a script that calls run_app must do
+    so under if __name__ == '__main__'.
+
+    Raises RuntimeError if a worker doesn't become ready at startup. Later on workers that
+    exit are restarted, with backoff while they keep dying before becoming ready.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    reserved = _reuseport_socket(host, port)
+    self.host = host
+    self.port = reserved.getsockname()[1]
+
+    def start_worker(idx: int) -> tuple[BaseProcess, ProcessEvent]:
+      ready = ctx.Event()
+      proc = ctx.Process(target=_worker_main, args=(server_factory, log, self.host, self.port, ready), name=f'alxhttp-worker-{idx}', daemon=True)
+      proc.start()
+      return proc, ready
+
+    slots: List[_WorkerSlot] = []
+    try:
+      for idx in range(num_workers):
+        proc, ready = start_worker(idx)
+        slots.append(_WorkerSlot(idx=idx, proc=proc, ready=ready, started_at=monotonic()))
+        self.workers.append(proc)
+      for slot in slots:
+        if not await _wait_ready(slot.proc, slot.ready, _worker_start_timeout):
+          raise RuntimeError(f'worker {slot.idx} failed to start (exitcode {slot.proc.exitcode})')
+      log.info({'message': f'listening on {self.host}:{self.port}', 'workers': num_workers})
+
+      while not self.shutdown_event.is_set():
+        try:
+          await asyncio.wait_for(self.shutdown_event.wait(), timeout=_worker_poll_interval)
+        except TimeoutError:
+          pass
+        if self.shutdown_event.is_set():
+          break
+        now = monotonic()
+        for slot in slots:
+          proc = slot.proc
+          if proc.is_alive():
+            if slot.ready.is_set():
+              slot.failures = 0
+            elif now - slot.started_at > _worker_start_timeout:
+              log.error({'message': 'worker did not become ready, killing it', 'worker': slot.idx, 'pid': proc.pid})
+              proc.kill()
+            continue
+
+          if slot.restart_at is None:
+            if slot.ready.is_set():
+              log.warning({'message': 'worker exited, restarting', 'worker': slot.idx, 'pid': proc.pid, 'exitcode': proc.exitcode})
+              slot.restart_at = now
+            else:
+              slot.failures += 1
+              delay = min(_worker_max_backoff, _worker_poll_interval * 2**slot.failures)
+              log.error({'message': 'worker failed to start, restarting', 'worker': slot.idx, 'pid': proc.pid, 'exitcode': proc.exitcode, 'failures': slot.failures, 'delay': delay})
+              slot.restart_at = now + delay
+          if now >= slot.restart_at:
+            proc.close()
+            slot.proc, slot.ready = start_worker(slot.idx)
+            slot.started_at = now
+            slot.restart_at = None
+            self.workers[slot.idx] = slot.proc
+    except (asyncio.exceptions.CancelledError, KeyboardInterrupt):
+      pass
+    finally:
+      await self._stop_workers()
+      reserved.close()
+
+  async def _stop_workers(self) -> None:
+    for proc in self.workers:
+      if proc.is_alive():
+        proc.terminate()
+    for proc in self.workers:
+      await asyncio.to_thread(proc.join, _worker_stop_timeout)
+      if proc.is_alive():
+        proc.kill()
+        await asyncio.to_thread(proc.join)
+    self.workers = []
+
+  async def _run_worker(self, log: logging.Logger, host: str, port: int, ready: ProcessEvent) -> None:
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.shutdown_event.set)
+
+    self.app.cleanup_ctx.append(self.setup_ctx)
+
+    runner = web.AppRunner(self.app, debug=True, access_log_class=self.access_log_class)
+    await runner.setup()
+    sock = _reuseport_socket(host, port)
+    site = web.SockSite(runner, sock)
+    await site.start()
+    ready.set()
+
+    try:
+      await self.shutdown_event.wait()
+    finally:
+      await runner.cleanup()
+      await self._flush_access_log()
+
+  async def _flush_access_log(self) -> None:
+    if issubclass(self.access_log_class, QueuedJSONAccessLogger):
+      await asyncio.to_thread(self.access_log_class.writer.flush, _worker_stop_timeout)
+
+
+def _worker_main(server_factory: Callable[[], Server], log: logging.Logger, host: str, port: int, ready: ProcessEvent) -> None:
+  # The supervisor owns ctrl-c, workers are stopped with SIGTERM
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  server = server_factory()
+  server.host, server.port = host, port
+  asyncio.run(server._run_worker(log, host, port, ready))
+
+
+async def _wait_ready(proc: BaseProcess, ready: ProcessEvent, timeout: float) -> bool:
+  deadline = monotonic() + timeout
+  while not ready.is_set():
+    if not proc.is_alive() or monotonic() >= deadline:
+      return False
+    await asyncio.sleep(0.05)
+  return True
 
 
 ServerType = TypeVar('ServerType', bound=Server)
@@ -0,0 +1,48 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight[K: Hashable, V]:
+  """
+  Coalesces concurrent calls for the same key: the first caller starts fn and anyone
+  asking for the key before it completes awaits that same result (or exception)
+  instead of starting their own. Nothing is kept once the call completes, so this only
+  removes duplicate work that is in flight at the same time, e.g.
+
+    org_lookups: SingleFlight[str, Org] = SingleFlight()
+
+    async def _get_org(pool: asyncpg.Pool, org_id: str) -> Org:
+      async with pool.acquire() as conn:
+        return await get_org.fetchrow(conn, org_id)
+
+    org = await org_lookups.do(org_id, lambda: _get_org(pool, org_id))
+
+  The shared call runs as its own task, so a caller being cancelled doesn't cancel it
+  for the others. That also means fn must not use anything owned by the caller, like a
+  connection the caller acquired, which goes back to the pool when the caller returns.
+  """
+
+  def __init__(self):
+    self._in_flight: Dict[K, asyncio.Task[V]] = {}
+    self.calls = 0
+    self.coalesced = 0
+
+  def __len__(self) -> int:
+    return len(self._in_flight)
+
+  async def do(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+    task = self._in_flight.get(key)
+    if task is None:
+      self.calls += 1
+      task = self._in_flight[key] = asyncio.ensure_future(fn())
+      task.add_done_callback(lambda t: self._done(key, t))
+    else:
+      self.coalesced += 1
+    return await asyncio.shield(task)
+
+  def _done(self, key: K, task: asyncio.Task[V]) -> None:
+    if self._in_flight.get(key) is task:
+      del self._in_flight[key]
+    if not task.cancelled():
+      # Mark it retrieved, for when every caller was cancelled
+      task.exception()
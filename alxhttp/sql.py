@@ -1,16 +1,27 @@
+import asyncio
+import hashlib
 import inspect
 import json
+import logging
+import multiprocessing
 import os
 import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Any, Callable, List, Type
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type, TypeGuard
 
 import asyncpg
 import pglast
+from asyncpg.prepared_stmt import PreparedStatement
 from typing_extensions import TypeVar
 
 from alxhttp.file_watcher import register_file_listener
+from alxhttp.logging import get_json_server_logger
 from alxhttp.pydantic.basemodel import BaseModel
+from alxhttp.req_id import current_log_context
 
 
 def get_caller_dir(idx: int = 1) -> Path:
@@ -23,21 +34,197 @@ def get_caller_dir(idx: int = 1) -> Path:
   if not current_frame:
     raise ValueError
 
-  frame_info = inspect.getframeinfo(current_frame)
-  return Path(os.path.dirname(os.path.abspath(frame_info.filename)))
+  # Just the filename, inspect.getframeinfo would also read the source around the call
+  return Path(os.path.dirname(os.path.abspath(current_frame.f_code.co_filename)))
 
 
 ListType = TypeVar('ListType')
 
+DEFAULT_CURSOR_BATCH_SIZE = 500
+
+
+async def _execute_prepared(stmt: PreparedStatement, *args) -> str:
+  await stmt.fetch(*args)
+  return stmt.get_statusmsg()
+
+
+@dataclass
+class StatementCacheStats:
+  hits: int = 0
+  misses: int = 0
+  invalidations: int = 0
+
+
+@dataclass
+class SQLFileStats:
+  calls: int = 0
+  errors: int = 0
+  slow_calls: int = 0
+  total_time: float = 0.0
+  max_time: float = 0.0
+  rows: int = 0
+  bytes_decoded: int = 0
+
+
+def _records_size(records: Sequence[asyncpg.Record]) -> Tuple[int, int]:
+  """
+  Row count and the (approximate) number of bytes decoded for them: the length of
+  every text/bytea value, which is what dominates for JSON columns, plus 8 bytes for
+  each other non-null value
+  """
+  nbytes = 0
+  for record in records:
+    for value in record.values():
+      if isinstance(value, (str, bytes)):
+        nbytes += len(value)
+      elif value is not None:
+        nbytes += 8
+  return len(records), nbytes
+
+
+def _record_size(record: Optional[asyncpg.Record]) -> Tuple[int, int]:
+  return _records_size([record]) if record is not None else (0, 0)
+
+
+def _status_size(status: str) -> Tuple[int, int]:
+  """
+  Rows affected according to a command status like 'INSERT 0 5'
+  """
+  count = status.rsplit(' ', 1)[-1] if status else ''
+  return (int(count) if count.isdigit() else 0), 0
+
+
+class SQLTiming:
+  """
+  Per SQL file timings for every SQLValidator call. Calls taking at least
+  slow_threshold seconds are also logged, along with the current request_id.
+  """
+
+  def __init__(self, slow_threshold: float, logger: logging.Logger):
+    self.slow_threshold = slow_threshold
+    self.logger = logger
+    self.stats: Dict[str, SQLFileStats] = {}
+    self._names: Dict[Path, str] = {}
+
+  def name(self, file: Path) -> str:
+    """
+    What stats are keyed by: the path relative to the working directory (normally the
+    project root), or just the file name for SQL files outside it
+    """
+    name = self._names.get(file)
+    if name is None:
+      rel = os.path.relpath(file)
+      name = self._names[file] = file.name if rel.startswith('..') else Path(rel).as_posix()
+    return name
+
+  def observe(self, file: Path, duration: float, rows: int, nbytes: int, error: bool = False) -> None:
+    name = self.name(file)
+    stats = self.stats.get(name)
+    if stats is None:
+      stats = self.stats[name] = SQLFileStats()
+    stats.calls += 1
+    stats.total_time += duration
+    stats.max_time = max(stats.max_time, duration)
+    stats.rows += rows
+    stats.bytes_decoded += nbytes
+    if error:
+      stats.errors += 1
+    if duration >= self.slow_threshold:
+      stats.slow_calls += 1
+      self.logger.warning(
+        {
+          'message': 'Slow SQL query',
+          'request_id': current_log_context.get()[0],
+          'sql_file': name,
+          'duration': round(duration, 6),
+          'rows': rows,
+          'bytes_decoded': nbytes,
+          'error': error,
+        }
+      )
+
+
+_sql_timing: Optional[SQLTiming] = None
+
+
+def enable_sql_timing(slow_threshold: float = 0.5, logger: Optional[logging.Logger] = None) -> SQLTiming:
+  """
+  Start timing SQLValidator calls. While disabled (the default) the only cost per call
+  is checking that timing is off.
+  """
+  global _sql_timing
+  if logger is None:
+    logger = get_json_server_logger()
+  _sql_timing = SQLTiming(slow_threshold, logger)
+  return _sql_timing
+
+
+def disable_sql_timing() -> None:
+  global _sql_timing
+  _sql_timing = None
+
+
+def get_sql_stats() -> Dict[str, SQLFileStats]:
+  """
+  A snapshot of the stats so far, keyed by SQL file (see SQLTiming.name)
+  """
+  if _sql_timing is None:
+    return {}
+  return {name: replace(stats) for name, stats in _sql_timing.stats.items()}
+
+
+# Every SQLValidator created so far, for validate_all_sql
+_validators: weakref.WeakSet['SQLValidator'] = weakref.WeakSet()
+
+_lazy_sql = False
+
+
+def enable_lazy_sql() -> None:
+  """
+  SQLValidators created after this only record their path. The SQL is read, validated
+  and watched for changes on first use, or for all of them at once by warm_up_sql.
+  """
+  global _lazy_sql
+  _lazy_sql = True
+
+
+def disable_lazy_sql() -> None:
+  global _lazy_sql
+  _lazy_sql = False
+
+
+def _owns_statements(conn: asyncpg.Connection | asyncpg.pool.PoolConnectionProxy) -> TypeGuard[asyncpg.Connection]:
+  """
+  Whether SQLValidator keeps its own prepared statements for conn, see SQLValidator
+  """
+  return not isinstance(conn, asyncpg.pool.PoolConnectionProxy)
+
 
 class SQLValidator[T: BaseModel]:
+  """
+  On a connection the caller holds on to (from asyncpg.connect, e.g. for a long running
+  job), the query is prepared once with conn.prepare() and the statement reused for
+  every later call, counted in statement_stats. Reloading the SQL file drops them.
+
+  asyncpg won't use a prepared statement once its connection has been released back to
+  the pool, so queries on pooled connections (PoolConnectionProxy) go through asyncpg's
+  own per-connection statement cache instead, which also prepares each query once per
+  connection (tune it with statement_cache_size on the pool, or set that to 0 behind
+  pgbouncer in transaction mode).
+  """
+
   def __init__(self, file: str | Path, cls: Type[T], stack_offset: int = 2):
     self.file = get_caller_dir(stack_offset) / file
     self._query = None
-    if modified_recently(self.file):
-      self.validate()
+    self.statement_stats = StatementCacheStats()
+    self._statements: weakref.WeakKeyDictionary[asyncpg.Connection, PreparedStatement] = weakref.WeakKeyDictionary()
+    self._watching = False
     self.cls = cls
-    register_file_listener(self.file, self.validate)
+    _validators.add(self)
+    if not _lazy_sql:
+      if modified_recently(self.file):
+        self.validate()
+      self._watch()
 
   def __str__(self):
     return self.query
@@ -50,22 +237,131 @@ class SQLValidator[T: BaseModel]:
     return self._query
 
   def validate(self) -> None:
-    self._query = validate_sql(self.file)
+    self._set_query(validate_sql(self.file))
+
+  def _set_query(self, query: str) -> None:
+    reloaded = self._query is not None
+    self._query = query
+    # Called from the file watcher thread, so swap rather than clear
+    self._statements = weakref.WeakKeyDictionary()
+    if reloaded:
+      self.statement_stats.invalidations += 1
+    self._watch()
+
+  def _watch(self) -> None:
+    if not self._watching:
+      self._watching = True
+      register_file_listener(self.file, self.validate)
+
+  async def _get_statement(self, conn: asyncpg.Connection) -> PreparedStatement:
+    query = self.query
+    statements = self._statements
+    stmt = statements.get(conn)
+    if stmt is not None:
+      self.statement_stats.hits += 1
+      return stmt
+
+    self.statement_stats.misses += 1
+    stmt = await conn.prepare(query)
+    statements[conn] = stmt
+    return stmt
+
+  async def _prepared_call[R](self, conn: asyncpg.Connection, call: Callable[[PreparedStatement], Awaitable[R]]) -> R:
+    stmt = await self._get_statement(conn)
+    try:
+      return await call(stmt)
+    except asyncpg.exceptions.InvalidCachedStatementError:
+      # The schema changed underneath the statement, so prepare it again
+      self._statements.pop(conn, None)
+      return await call(await self._get_statement(conn))
+
+  async def _timed[R](self, timing: SQLTiming, call: Awaitable[R], size: Callable[[R], Tuple[int, int]]) -> R:
+    start = time.perf_counter()
+    try:
+      result = await call
+    except asyncio.CancelledError:
+      timing.observe(self.file, time.perf_counter() - start, 0, 0)
+      raise
+    except Exception:
+      timing.observe(self.file, time.perf_counter() - start, 0, 0, error=True)
+      raise
+    rows, nbytes = size(result)
+    timing.observe(self.file, time.perf_counter() - start, rows, nbytes)
+    return result
+
+  async def _fetch(self, conn: asyncpg.pool.PoolConnectionProxy, *args) -> List[asyncpg.Record]:
+    if _owns_statements(conn):
+      call = self._prepared_call(conn, lambda stmt: stmt.fetch(*args))
+    else:
+      call = conn.fetch(self.query, *args)
+    if _sql_timing is not None:
+      return await self._timed(_sql_timing, call, _records_size)
+    return await call
 
   async def fetchrow(self, conn: asyncpg.pool.PoolConnectionProxy, *args) -> T:
-    record = await conn.fetchrow(self.query, *args)
+    if _owns_statements(conn):
+      call = self._prepared_call(conn, lambda stmt: stmt.fetchrow(*args))
+    else:
+      call = conn.fetchrow(self.query, *args)
+    if _sql_timing is not None:
+      record = await self._timed(_sql_timing, call, _record_size)
+    else:
+      record = await call
     return self.cls.from_record(record)
 
   async def fetch(self, conn: asyncpg.pool.PoolConnectionProxy, *args) -> List[T]:
-    records = await conn.fetch(self.query, *args)
+    records = await self._fetch(conn, *args)
     return [self.cls.from_record(record) for record in records]
 
   async def fetchlist[TT](self, list_type: Type[TT], conn: asyncpg.pool.PoolConnectionProxy, *args) -> List[TT]:
-    records = await conn.fetch(self.query, *args)
+    records = await self._fetch(conn, *args)
     return [list_type(record[0]) for record in records]  # type: ignore
 
+  async def cursor(self, conn: asyncpg.pool.PoolConnectionProxy, *args, batch_size: int = DEFAULT_CURSOR_BATCH_SIZE) -> AsyncIterator[T]:
+    """
+    Yield validated models one at a time while reading the results through a server-side
+    cursor, batch_size rows per round trip. Cursors only live inside a transaction so one
+    is opened if the connection isn't already in one.
+    """
+    async with nullcontext() if conn.is_in_transaction() else conn.transaction():
+      if _owns_statements(conn):
+        records = (await self._get_statement(conn)).cursor(*args, prefetch=batch_size)
+      else:
+        records = conn.cursor(self.query, *args, prefetch=batch_size)
+
+      timing = _sql_timing
+      if timing is None:
+        async for record in records:
+          yield self.cls.from_record(record)
+        return
+
+      # The time includes however long the caller spends between rows
+      start = time.perf_counter()
+      rows = nbytes = 0
+      error = True
+      try:
+        async for record in records:
+          rows += 1
+          nbytes += _record_size(record)[1]
+          yield self.cls.from_record(record)
+        error = False
+      except (GeneratorExit, asyncio.CancelledError):
+        # The caller stopped early (broke out and closed it, or was cancelled), the
+        # query itself didn't fail
+        error = False
+        raise
+      finally:
+        timing.observe(self.file, time.perf_counter() - start, rows, nbytes, error=error)
+
   async def execute(self, conn: asyncpg.pool.PoolConnectionProxy, *args) -> str:
-    return await conn.execute(self.query, *args)
+    # Without args this uses the simple query protocol which allows multiple statements
+    if args and _owns_statements(conn):
+      call = self._prepared_call(conn, lambda stmt: _execute_prepared(stmt, *args))
+    else:
+      call = conn.execute(self.query, *args)
+    if _sql_timing is not None:
+      return await self._timed(_sql_timing, call, _status_size)
+    return await call
 
 
 class SQLArgValidator[T: BaseModel, **P, PT](SQLValidator):
@@ -80,15 +376,14 @@ class SQLArgValidator[T: BaseModel, **P, PT](SQLValidator):
 
     This also gives a natural place to perform some type conversions
     """
-    ordered = []
-    for field_name in self.argorder.model_fields.keys():
-      arg = kwargs[field_name]
-      if isinstance(arg, BaseModel):
-        arg = arg.model_dump_json()
-      elif isinstance(arg, dict):
-        arg = json.dumps(arg)
-      ordered.append(arg)
-    return ordered
+    return [_convert_query_arg(kwargs[field_name]) for field_name in self.argorder.model_fields.keys()]
+
+  def _get_model_query_args(self, item: PT) -> List[Any]:
+    """
+    The same ordering and conversions as _get_query_args, but reading the fields from an
+    instance of `argorder`
+    """
+    return [_convert_query_arg(getattr(item, field_name)) for field_name in self.argorder.model_fields.keys()]
 
   async def fetchrow(self, conn: asyncpg.pool.PoolConnectionProxy, *args: P.args, **kwargs: P.kwargs) -> T:
     return await super().fetchrow(conn, *self._get_query_args(*args, **kwargs))
@@ -99,9 +394,51 @@ class SQLArgValidator[T: BaseModel, **P, PT](SQLValidator):
   async def fetchlist[TT](self, list_type: Type[TT], conn: asyncpg.pool.PoolConnectionProxy, *args: P.args, **kwargs: P.kwargs) -> List[TT]:
     return await super().fetchlist(list_type, conn, *self._get_query_args(*args, **kwargs))
 
+  def cursor(self, conn: asyncpg.pool.PoolConnectionProxy, *args: P.args, batch_size: int = DEFAULT_CURSOR_BATCH_SIZE, **kwargs: P.kwargs) -> AsyncIterator[T]:
+    return super().cursor(conn, *self._get_query_args(*args, **kwargs), batch_size=batch_size)
+
   async def execute(self, conn: asyncpg.pool.PoolConnectionProxy, *args: P.args, **kwargs: P.kwargs) -> str:
     return await super().execute(conn, *self._get_query_args(*args, **kwargs))
 
+  async def execute_many(self, conn: asyncpg.pool.PoolConnectionProxy, items: Iterable[PT]) -> None:
+    """
+    Run the query once per item in a single round trip (asyncpg executemany)
+    """
+    args = [self._get_model_query_args(item) for item in items]
+    if not args:
+      return
+    if _owns_statements(conn):
+      call = self._prepared_call(conn, lambda stmt: stmt.executemany(args))
+    else:
+      call = conn.executemany(self.query, args)
+    if _sql_timing is not None:
+      await self._timed(_sql_timing, call, lambda _: (len(args), 0))
+    else:
+      await call
+
+  async def copy_records(self, conn: asyncpg.pool.PoolConnectionProxy, table_name: str, items: Iterable[PT], schema_name: str | None = None) -> str:
+    """
+    Bulk load items with COPY into table_name. This bypasses the SQL file entirely, the
+    fields of `argorder` are used as the column names (in order).
+    """
+    call = conn.copy_records_to_table(
+      table_name,
+      records=[self._get_model_query_args(item) for item in items],
+      columns=list(self.argorder.model_fields.keys()),
+      schema_name=schema_name,
+    )
+    if _sql_timing is not None:
+      return await self._timed(_sql_timing, call, _status_size)
+    return await call
+
+
+def _convert_query_arg(arg: Any) -> Any:
+  if isinstance(arg, BaseModel):
+    return arg.model_dump_json()
+  elif isinstance(arg, dict):
+    return json.dumps(arg)
+  return arg
+
 
 def modified_recently(path: Path) -> bool:
   current_time = time.time()
@@ -109,13 +446,139 @@ def modified_recently(path: Path) -> bool:
   return (current_time - modification_time) <= 600
 
 
+_sql_cache_dir: Optional[Path] = None
+
+
+def enable_sql_validation_cache(cache_dir: Optional[str | Path] = None) -> Path:
+  """
+  Remember which SQL texts parsed (keyed by a hash of the text and the pglast version) so
+  validate_sql doesn't parse them again on the next start. Off by default. The cache goes
+  in cache_dir, or $ALXHTTP_SQL_CACHE_DIR, or alxhttp/sql under $XDG_CACHE_HOME
+  (~/.cache). Setting $ALXHTTP_SQL_CACHE_DIR also turns it on without calling this.
+  """
+  global _sql_cache_dir
+  if cache_dir is None:
+    cache_dir = os.environ.get('ALXHTTP_SQL_CACHE_DIR') or Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'alxhttp' / 'sql'
+  _sql_cache_dir = Path(cache_dir)
+  return _sql_cache_dir
+
+
+def disable_sql_validation_cache() -> None:
+  global _sql_cache_dir
+  _sql_cache_dir = None
+
+
+def _get_sql_cache_dir() -> Optional[Path]:
+  if _sql_cache_dir is not None:
+    return _sql_cache_dir
+  cache_dir = os.environ.get('ALXHTTP_SQL_CACHE_DIR')
+  return Path(cache_dir) if cache_dir else None
+
+
+def _sql_cache_key(txt: str) -> str:
+  # A different pglast could disagree about what parses
+  return hashlib.sha256(f'{pglast.__version__}\n{txt}'.encode()).hexdigest()
+
+
+def _is_validated(cache_dir: Optional[Path], key: str) -> bool:
+  return cache_dir is not None and (cache_dir / key).exists()
+
+
+def _mark_validated(cache_dir: Optional[Path], key: str) -> None:
+  """
+  Only successes are cached, so a bad file always gets a fresh parse error
+  """
+  if cache_dir is None:
+    return
+  try:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / key).touch()
+  except OSError:
+    pass
+
+
+def _parse_sql(txt: str) -> Optional[str]:
+  """
+  Runs in the process pool, so it returns the error rather than raising it
+  """
+  try:
+    pglast.parser.parse_sql(txt)
+    return None
+  except Exception as e:
+    return repr(e)
+
+
 def validate_sql(sql_file: Path) -> str:
   with open(sql_file) as f:
     txt = f.read()
 
+  cache_dir = _get_sql_cache_dir()
+  key = _sql_cache_key(txt)
+  if _is_validated(cache_dir, key):
+    return txt
+
   try:
     pglast.parser.parse_sql(txt)
-    print(f'validated {sql_file}')
-    return txt
   except Exception as e:
     raise ValueError(f'Unable to parse {sql_file}') from e
+  _mark_validated(cache_dir, key)
+  print(f'validated {sql_file}')
+  return txt
+
+
+# Below this many files to parse, starting a process pool costs more than it saves
+_min_parallel_files = 8
+
+
+def validate_sql_files(sql_files: Iterable[Path], max_workers: Optional[int] = None) -> Dict[Path, str]:
+  """
+  validate_sql for many files at once. Files that aren't in the cache are parsed in a
+  process pool. Raises ValueError naming every file that failed to parse.
+
+  The pool's processes are spawned, which re-imports the main module in each of them, so
+  a script that calls this (or validate_all_sql / warm_up_sql) must do so under
+  if __name__ == '__main__'. Inside a child process, e.g. a spawned server worker, files
+  are parsed inline rather than starting a pool of its own.
+  """
+  cache_dir = _get_sql_cache_dir()
+  texts: Dict[Path, str] = {}
+  to_parse: Dict[Path, str] = {}
+  for sql_file in sql_files:
+    with open(sql_file) as f:
+      txt = texts[sql_file] = f.read()
+    if not _is_validated(cache_dir, _sql_cache_key(txt)):
+      to_parse[sql_file] = txt
+
+  if len(to_parse) >= _min_parallel_files and max_workers != 1 and multiprocessing.parent_process() is None:
+    # spawn rather than fork, the file watcher's thread is already running
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+      errors = dict(zip(to_parse.keys(), pool.map(_parse_sql, to_parse.values(), chunksize=4)))
+  else:
+    errors = {sql_file: _parse_sql(txt) for sql_file, txt in to_parse.items()}
+
+  failed = {sql_file: error for sql_file, error in errors.items() if error is not None}
+  for sql_file in to_parse.keys() - failed.keys():
+    _mark_validated(cache_dir, _sql_cache_key(to_parse[sql_file]))
+    print(f'validated {sql_file}')
+  if failed:
+    raise ValueError('Unable to parse ' + ', '.join(f'{sql_file} ({error})' for sql_file, error in failed.items()))
+  return texts
+
+
+def validate_all_sql(max_workers: Optional[int] = None) -> None:
+  """
+  Load and validate the SQL for every SQLValidator that hasn't been loaded yet, in
+  parallel. Call at startup, once the modules defining the queries are imported.
+  """
+  pending = [v for v in list(_validators) if v._query is None]
+  texts = validate_sql_files({v.file for v in pending}, max_workers=max_workers)
+  for v in pending:
+    v._set_query(texts[v.file])
+
+
+async def warm_up_sql(max_workers: Optional[int] = None) -> None:
+  """
+  validate_all_sql without blocking the event loop, e.g. as a background task started
+  from an app's setup_ctx when lazy SQL loading is enabled
+  """
+  await asyncio.get_running_loop().run_in_executor(None, validate_all_sql, max_workers)
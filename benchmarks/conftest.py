@@ -0,0 +1,77 @@
+"""
+Shared fixtures for the pytest-benchmark suite. Run with:
+
+  python -m pytest -o addopts='' benchmarks --benchmark-only
+"""
+
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any, Coroutine, Dict, TypeVar
+
+import pytest
+
+from example.sqlserver import GoogleAccount, OrgUsers, UsersWithRoles
+
+T = TypeVar('T')
+
+USER_COUNT = 50
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+  """
+  Drive a coroutine that never actually suspends (e.g. a middleware around a handler
+  that doesn't do I/O) without paying for an event loop iteration, so the timings are
+  of the code under test rather than of the loop.
+  """
+  try:
+    coro.send(None)
+  except StopIteration as e:
+    return e.value
+  coro.close()
+  raise RuntimeError('benchmarked coroutine suspended')
+
+
+def _user(idx: int) -> UsersWithRoles:
+  now = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+  return UsersWithRoles(
+    user_id=f'u_{idx:012x}',
+    created_at=now,
+    updated_at=now,
+    google=GoogleAccount(
+      sub=str(idx),
+      email=f'user{idx}@example.com',
+      email_verified=True,
+      hd='example.com',
+      name=f'User {idx}',
+      picture=None,
+      given_name='User',
+      family_name=str(idx),
+      created_at=now,
+      updated_at=now,
+    ),
+    roles=['admin', 'member'] if idx % 2 else ['member'],
+  )
+
+
+@pytest.fixture(scope='session')
+def org_users() -> OrgUsers:
+  users = [_user(idx) for idx in range(USER_COUNT)]
+  return OrgUsers(org_id='org_000000000001', users={u.user_id: u for u in users})
+
+
+@pytest.fixture(scope='session')
+def org_users_record(org_users: OrgUsers) -> Dict[str, Any]:
+  """
+  OrgUsers as asyncpg hands it back: the users column is a JSON string
+  """
+  return {'org_id': org_users.org_id, 'users': json.dumps(org_users.model_dump(mode='json')['users'])}
+
+
+@pytest.fixture
+def loop():
+  loop = asyncio.new_event_loop()
+  asyncio.set_event_loop(loop)
+  yield loop
+  asyncio.set_event_loop(None)
+  loop.close()
@@ -0,0 +1,77 @@
+"""
+Per-request latency of the default middleware as the single fused_defaults middleware
+versus the equivalent stack of individual middlewares, measured end to end through
+aiohttp's test server.
+
+  python -m benchmarks.middleware_chain
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+from typing import Dict, List
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiohttp.typedefs import Middleware
+
+from alxhttp.middleware.defaults import default_middleware
+from alxhttp.pydantic.route import add_route
+from example.server import ExampleServer, validated_api
+
+ROUNDS = 5
+REQUESTS = 1_000
+WARMUP = 200
+
+# A success, an aiohttp error turned into JSON, and a pydantic validation failure
+PATHS = ['/api/test', '/api/default-aiohttp-error', '/api/users/notanint']
+
+
+async def _latencies(middlewares: List[Middleware], path: str) -> List[float]:
+  s = ExampleServer(middlewares=middlewares)
+  add_route(s, s.app.router, validated_api)
+  async with TestClient(TestServer(s.app)) as client:
+    for _ in range(WARMUP):
+      async with client.get(path, json={}) as resp:
+        await resp.read()
+
+    latencies = []
+    for _ in range(REQUESTS):
+      start = time.perf_counter()
+      async with client.get(path, json={}) as resp:
+        await resp.read()
+      latencies.append(time.perf_counter() - start)
+  return latencies
+
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+  q = statistics.quantiles(latencies, n=100)
+  return {
+    'mean': statistics.fmean(latencies) * 1e6,
+    'p50': q[49] * 1e6,
+    'p99': q[98] * 1e6,
+  }
+
+
+async def main() -> None:
+  # Keep log formatting and writes out of the measurement
+  logging.disable(logging.CRITICAL)
+
+  for path in PATHS:
+    # Alternate rounds so drift in machine load hits both chains equally
+    stacked_latencies: List[float] = []
+    fused_latencies: List[float] = []
+    for _ in range(ROUNDS):
+      stacked_latencies += await _latencies(default_middleware(fused=False), path)
+      fused_latencies += await _latencies(default_middleware(), path)
+    stacked = _summary(stacked_latencies)
+    fused = _summary(fused_latencies)
+    print(path)
+    for name, stats in (('stacked', stacked), ('fused', fused)):
+      print(f'  {name:8} mean {stats["mean"]:8.1f} us  p50 {stats["p50"]:8.1f} us  p99 {stats["p99"]:8.1f} us')
+    saved = stacked['mean'] - fused['mean']
+    print(f'  saved    {saved:8.1f} us/request ({saved / stacked["mean"]:.1%})')
+
+
+if __name__ == '__main__':
+  asyncio.run(main())
@@ -0,0 +1,155 @@
+"""
+Each layer of the request pipeline on its own, then the whole thing end to end.
+
+Save a baseline and gate later runs on it with pytest-benchmark:
+
+  python -m pytest -o addopts='' benchmarks --benchmark-only --benchmark-autosave
+  python -m pytest -o addopts='' benchmarks --benchmark-only --benchmark-compare --benchmark-compare-fail=median:10%
+
+or the same through tox: tox -e bench -- --benchmark-compare --benchmark-compare-fail=median:10%
+"""
+
+import io
+import json
+import logging
+import os
+from typing import Any, Dict
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+from aiohttp.web import HTTPNotFound, StreamResponse
+from aiohttp.web import Request as WebRequest
+
+from alxhttp.json import json_dumps, json_response
+from alxhttp.logging import AccessLogWriter, JSONAccessLogger, QueuedJSONAccessLogger
+from alxhttp.metrics import MetricsRegistry, metrics_middleware
+from alxhttp.middleware.defaults import default_middleware
+from alxhttp.middleware.fused_defaults import fused_defaults
+from alxhttp.pydantic.basemodel import Empty
+from alxhttp.pydantic.request import Request
+from alxhttp.pydantic.response import Response
+from alxhttp.pydantic.route import add_route, get_route_details, route
+from alxhttp.server import Server
+from alxhttp.tests.stream_reader import BytesStreamReader
+from alxhttp.typescript.wrappers.gen_get_wrapper import generate_get_api_wrapper
+from benchmarks.conftest import run_sync
+from example.sqlserver import MatchInfo, OrgData, OrgUsers
+
+_org_id = 'org_000000000001'
+
+
+async def _ok_handler(request: WebRequest) -> StreamResponse:
+  return json_response({})
+
+
+async def _not_found_handler(request: WebRequest) -> StreamResponse:
+  raise HTTPNotFound()
+
+
+def _stack(handler, middlewares):
+  for m in reversed(middlewares):
+    handler = _bind(m, handler)
+  return handler
+
+
+def _bind(m, handler):
+  async def wrapped(request):
+    return await m(request, handler)
+
+  return wrapped
+
+
+@pytest.mark.parametrize('fused', [True, False], ids=['fused', 'stacked'])
+@pytest.mark.parametrize('handler', [_ok_handler, _not_found_handler], ids=['ok', 'not_found'])
+def test_middleware_chain(benchmark, loop, fused, handler):
+  chain = _stack(handler, default_middleware(fused=fused))
+  request = make_mocked_request('GET', '/api/test', loop=loop)
+  benchmark(lambda: run_sync(chain(request)))
+
+
+def test_metrics_middleware(benchmark, loop):
+  registry = MetricsRegistry()
+  chain = _stack(_ok_handler, [metrics_middleware(registry)])
+  request = make_mocked_request('GET', '/api/test', loop=loop)
+  benchmark(lambda: run_sync(chain(request)))
+
+
+def test_request_from_request(benchmark, loop):
+  request_cls = Request[MatchInfo, OrgData, Empty]
+  body = json.dumps({'org_name': 'An Org'}).encode()
+
+  def setup():
+    req = make_mocked_request('POST', f'/api/orgs/{_org_id}', payload=BytesStreamReader(body, loop=loop), loop=loop)
+    req.match_info['org_id'] = _org_id
+    return (req,), {}
+
+  benchmark.pedantic(lambda req: run_sync(request_cls.from_request(req)), setup=setup, rounds=5000)
+
+
+def test_response_serialization(benchmark, org_users: OrgUsers):
+  benchmark(lambda: Response(body=org_users))
+
+
+def test_from_record_nested_json(benchmark, org_users_record: Dict[str, Any]):
+  benchmark(OrgUsers.from_record, org_users_record)
+
+
+def test_json_dumps(benchmark, org_users: OrgUsers):
+  data = org_users.model_dump()
+  benchmark(json_dumps, data)
+
+
+@pytest.mark.parametrize('queued', [False, True], ids=['sync', 'queued'])
+def test_access_log(benchmark, loop, queued):
+  logger = logging.getLogger('benchmarks.access')
+  logger.propagate = False
+  logger.setLevel(logging.INFO)
+  logger.handlers = [logging.StreamHandler(io.StringIO())]
+
+  if queued:
+
+    class BenchAccessLogger(QueuedJSONAccessLogger):
+      writer = AccessLogWriter(stream=open(os.devnull, 'w'))
+
+    access_logger: JSONAccessLogger = BenchAccessLogger(logger, '')
+  else:
+    access_logger = JSONAccessLogger(logger, '')
+
+  request = make_mocked_request('GET', f'/api/orgs/{_org_id}/users', loop=loop)
+  response = StreamResponse()
+  benchmark(access_logger.log, request, response, 0.0123)
+
+
+def test_typescript_generation(benchmark, org_users: OrgUsers):
+  @route('GET', '/api/orgs/{org_id}/users', match_info=MatchInfo, response=OrgUsers)
+  async def get_users_for_org(server: Server, request: Request[MatchInfo, Empty, Empty]) -> Response[OrgUsers]:
+    return Response(body=org_users)
+
+  rd = get_route_details(get_users_for_org)
+  benchmark(lambda: generate_get_api_wrapper(rd, out=io.StringIO()))
+
+
+def test_end_to_end(benchmark, loop, org_users: OrgUsers):
+  """
+  A GET through aiohttp's test server, default middleware and a @route handler
+  returning the org's users
+  """
+
+  @route('GET', '/api/orgs/{org_id}/users', match_info=MatchInfo, response=OrgUsers)
+  async def get_users_for_org(server: Server, request: Request[MatchInfo, Empty, Empty]) -> Response[OrgUsers]:
+    return Response(body=org_users)
+
+  server = Server(middlewares=[fused_defaults])
+  add_route(server, server.app.router, get_users_for_org)
+  client = TestClient(TestServer(server.app), loop=loop)
+  loop.run_until_complete(client.start_server())
+
+  async def get():
+    async with client.get(f'/api/orgs/{_org_id}/users') as resp:
+      assert resp.status == 200
+      return await resp.read()
+
+  try:
+    benchmark(lambda: loop.run_until_complete(get()))
+  finally:
+    loop.run_until_complete(client.close())
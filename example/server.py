@@ -8,7 +8,7 @@ from typing import List, Optional
 
 from aiohttp import BodyPartReader, MultipartReader
 from aiohttp.typedefs import Middleware
-from aiohttp.web import HTTPBadRequest, HTTPInsufficientStorage, Request, Response, json_response
+from aiohttp.web import HTTPBadRequest, HTTPInsufficientStorage, Request, Response, StreamResponse, json_response
 
 from alxhttp.cookies import HiddenCookie, PlainCookie
 from alxhttp.errors import HTTPBadRequest as AlxHTTPBadRequest
@@ -17,6 +17,7 @@ from alxhttp.pydantic.basemodel import BaseModel, Empty, ErrorModel
 from alxhttp.pydantic.request import Request as ModelReq
 from alxhttp.pydantic.response import EmptyResponse
 from alxhttp.pydantic.response import Response as ModelResp
+from alxhttp.pydantic.response import stream_response
 from alxhttp.pydantic.route import add_route, route
 from alxhttp.server import Server
 from alxhttp.xray import init_xray
@@ -141,6 +142,16 @@ class RespType(MatchInfo, Body):
   pass
 
 
+async def _stream_users(count: int):
+  for user_id in range(count):
+    yield MatchInfo(user_id=user_id)
+
+
+async def handler_test_stream(s: ExampleServer, req: Request) -> StreamResponse:
+  count = int(req.query.get('count', '3'))
+  return await stream_response(req, _stream_users(count), ndjson=req.query.get('format') != 'array')
+
+
 class ExampleServer(Server):
   def __init__(self, middlewares: Optional[List[Middleware]] = None, logger: Optional[logging.Logger] = None):
     super().__init__(middlewares=middlewares, logger=logger)
@@ -171,6 +182,8 @@ class ExampleServer(Server):
 
     self.app.router.add_get(r'/api/nonpydantic400', partial(handler_normal_400, self))
 
+    self.app.router.add_get(r'/api/stream', partial(handler_test_stream, self))
+
 
 @route('GET', '/api/empty', ts_name='overrideTsName', match_info=Empty, body=Empty, response=Empty)
 async def validated_empty_api(server: ExampleServer, request: ModelReq[Empty, Empty, Empty]) -> EmptyResponse:
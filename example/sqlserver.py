@@ -138,6 +138,14 @@ async def create_org(server: ExampleServer, request: Request[MatchInfo, OrgData,
   return Response(body=org)
 
 
+class NewOrg(BaseModel):
+  org_id: OrgID
+  org_name: str
+
+
+CREATE_ORGS = SQLArgValidator('sqlserver_create_orgs.sql', Empty, NewOrg)
+
+
 class OrgDelete(BaseModel):
   org_id: str
 
@@ -0,0 +1,4 @@
+insert into
+  usermodel.orgs (org_id, org_name)
+values
+  ($1, $2)
\ No newline at end of file
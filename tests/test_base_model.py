@@ -1,11 +1,13 @@
 import json
 import logging
 import unittest
-from typing import Dict, List
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
 
 import pydantic
 
-from alxhttp.pydantic.basemodel import recursive_json_loads
+from alxhttp.pydantic.basemodel import BaseModel, compile_json_loader, recursive_json_loads
+from alxhttp.pydantic.response import Response
 
 log = logging.getLogger()
 
@@ -67,6 +69,42 @@ class ModelTest9(pydantic.BaseModel):
   foo: ModelTest1 | ModelTest2
 
 
+class Tree(pydantic.BaseModel):
+  name: str
+  children: List['Tree']
+
+
+class Unresolved(pydantic.BaseModel):
+  name: str
+  other: 'NotDefinedYet'  # noqa: F821
+
+
+class HasUnresolved(pydantic.BaseModel):
+  tree: Tree
+  items: List[Unresolved]
+
+
+class Org(BaseModel):
+  org_id: str
+  users: Dict[str, Model]
+
+
+class WithDates(BaseModel):
+  at: datetime
+  maybe_at: Optional[datetime]
+  ats: List[datetime]
+  day: date
+
+
+class PlainDates(pydantic.BaseModel):
+  at: datetime
+
+
+class HasDates(BaseModel):
+  dates: WithDates
+  plain: PlainDates
+
+
 class TestBasic(unittest.IsolatedAsyncioTestCase):
   def test_rec_load1(self):
     assert recursive_json_loads(ModelTest1, {}) == {}
@@ -214,3 +252,46 @@ class TestBasic(unittest.IsolatedAsyncioTestCase):
         }
       },
     ) == {'foo': {'some_id': 42}}
+
+  def test_compiled_loader_is_cached(self):
+    assert compile_json_loader(ModelTest2) is compile_json_loader(ModelTest2)
+    assert compile_json_loader(ModelTest1)({'some_id': 'a'}) == {'some_id': 'a'}
+    assert compile_json_loader(str)('[1]') == '[1]'
+
+  def test_compiled_loader_self_reference(self):
+    assert recursive_json_loads(
+      Tree,
+      {
+        'name': 'a',
+        'children': json.dumps([{'name': 'b', 'children': [json.dumps({'name': 'c', 'children': []})]}]),
+      },
+    ) == {'name': 'a', 'children': [{'name': 'b', 'children': [{'name': 'c', 'children': []}]}]}
+
+  def test_compiled_loader_failure_not_cached(self):
+    for _ in range(2):
+      with self.assertRaises(NameError):
+        compile_json_loader(HasUnresolved)
+      with self.assertRaises(NameError):
+        compile_json_loader(Unresolved)
+    # models compiled on the way are fine
+    assert recursive_json_loads(Tree, {'name': 'a', 'children': '[]'}) == {'name': 'a', 'children': []}
+
+  def test_from_record(self):
+    m = Org.from_record({'org_id': 'o', 'users': json.dumps({'u': {'some_id': 'u', 'some_name': None}})})
+    assert m == Org(org_id='o', users={'u': Model(some_id='u', some_name=None)})
+
+  def test_datetimes_as_timestamps(self):
+    dt = datetime(2000, 1, 2, microsecond=42, tzinfo=timezone.utc)
+    m = WithDates(at=dt, maybe_at=None, ats=[dt], day=date(2000, 1, 2))
+    assert json.loads(m.model_dump_json()) == {'at': dt.timestamp(), 'maybe_at': None, 'ats': [dt.timestamp()], 'day': '2000-01-02'}
+
+    # python mode too, so json.dumps(m.model_dump()) works
+    assert m.model_dump() == {'at': dt.timestamp(), 'maybe_at': None, 'ats': [dt.timestamp()], 'day': date(2000, 1, 2)}
+    nested = HasDates(dates=m, plain=PlainDates(at=dt))
+    assert nested.model_dump() == {'dates': m.model_dump(), 'plain': {'at': dt}}
+    assert json.loads(nested.model_dump_json()) == {'dates': json.loads(m.model_dump_json()), 'plain': {'at': '2000-01-02T00:00:00.000042Z'}}
+
+    resp = Response(body=m)
+    assert resp.body == m.model_dump_json().encode()
+    assert resp.content_type == 'application/json'
+    assert resp.charset == 'utf-8'
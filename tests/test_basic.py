@@ -1,19 +1,31 @@
 import asyncio
+import dataclasses
+import enum
+import gzip
 import json
 import logging
+import math
+import os
+import re
+import signal
+import tempfile
 import unittest
-from datetime import datetime
+import uuid
+from datetime import date, datetime
 from unittest.mock import ANY
 
 import aiohttp
 import pydantic
+import pytest
+from aiohttp import web
 from yarl import URL
 
-from alxhttp.json import json_response
+from alxhttp.json import available_json_backends, get_json_backend, json_default, json_dumpb, json_dumps, json_response, set_json_backend
 from alxhttp.middleware.defaults import default_middleware
 from alxhttp.middleware.g_state import g_state
-from alxhttp.middleware.save_json import save_json
-from example.server import ExampleServer
+from alxhttp.middleware.save_json import JSONRecorder, record_json, save_json
+from alxhttp.pydantic.route import add_route
+from example.server import ExampleServer, validated_api
 from tests.debug_mode import set_debug_mode
 
 log = logging.getLogger()
@@ -24,6 +36,24 @@ class Foo:
     return 'foo'
 
 
+def _broken_server() -> ExampleServer:
+  raise RuntimeError('broken')
+
+
+class ConstrainedBody(pydantic.BaseModel):
+  count: int = pydantic.Field(gt=0)
+
+
+class Color(enum.Enum):
+  RED = 'red'
+
+
+@dataclasses.dataclass
+class Point:
+  x: int
+  y: int
+
+
 class ModelTest(pydantic.BaseModel):
   some_id: str
 
@@ -57,6 +87,44 @@ class TestBasic(unittest.IsolatedAsyncioTestCase):
     r = json_response(x)
     assert json.loads(r.text or '') == {'some_id': 'foo'}
 
+  def test_json_backends(self):
+    data = {'b': [1, datetime(year=2000, month=1, day=2, microsecond=42)], 'a': Foo(), 'c': ModelTest(some_id='x')}
+    old_backend = get_json_backend()
+    try:
+      set_json_backend('compat')
+      assert json_dumps(data) == json.dumps(data, indent=0, sort_keys=True, default=json_default)
+      assert json_dumpb(data) == json_dumps(data).encode()
+
+      set_json_backend('stdlib')
+      expected = json.loads(json_dumps(data))
+      assert expected == {'b': [1, ANY], 'a': 'foo', 'c': {'some_id': 'x'}}
+      assert json.loads(json_dumps({3: 1})) == {'3': 1}
+      assert str(expected['b'][1]).endswith('.000042')
+
+      r = json_response(data)
+      assert r.body == json_dumpb(data)
+      assert r.content_type == 'application/json'
+      assert r.charset == 'utf-8'
+
+      # the same, whatever orjson would do natively
+      same = [Point(1, 2), uuid.UUID(int=5), date(2000, 1, 2)]
+      assert json_dumps(same) == '["Point(x=1, y=2)","00000000-0000-0000-0000-000000000005","2000-01-02"]'
+      # and the known differences
+      assert json_dumps([Color.RED, math.nan]) == '["Color.RED",NaN]'
+
+      if 'orjson' in available_json_backends():
+        set_json_backend('orjson')
+        assert json.loads(json_dumps(data)) == expected
+        assert json.loads(json_dumps({3: 1})) == {'3': 1}
+        assert json.loads(json_dumpb([2**70])) == [2**70]
+        assert json_dumps(same) == '["Point(x=1, y=2)","00000000-0000-0000-0000-000000000005","2000-01-02"]'
+        assert json_dumps([Color.RED, math.nan]) == '["red",null]'
+
+      with pytest.raises(ValueError):
+        set_json_backend('nope')
+    finally:
+      set_json_backend(old_backend)
+
   async def test_cancel(self):
     s = ExampleServer(middlewares=[])
     async with asyncio.TaskGroup() as tg:
@@ -87,6 +155,90 @@ class TestBasic(unittest.IsolatedAsyncioTestCase):
             }
         s.shutdown_event.set()
 
+  async def test_api_workers(self):
+    s = ExampleServer()
+    async with asyncio.timeout(60):
+      async with asyncio.TaskGroup() as tg:
+        tg.create_task(s.run_app(log, workers=2))
+        await asyncio.sleep(1)
+        assert len(s.workers) == 2
+        async with aiohttp.ClientSession() as session:
+          # workers are spawned, so wait for them to import everything
+          while True:
+            try:
+              async with session.get(URL.build(host=s.host, port=s.port, path='/api/test')):
+                break
+            except aiohttp.ClientConnectionError:
+              await asyncio.sleep(0.2)
+
+          for _ in range(4):
+            async with session.get(URL.build(host=s.host, port=s.port, path='/api/test')) as resp:
+              assert resp.status == 200
+              assert (await resp.text()) == '{}'
+
+          # crashed workers get replaced on the same port
+          old_pid = s.workers[0].pid
+          assert old_pid
+          os.kill(old_pid, signal.SIGKILL)
+          await asyncio.sleep(1)
+          assert s.workers[0].pid != old_pid
+          assert s.workers[0].is_alive()
+
+          async with session.get(URL.build(host=s.host, port=s.port, path='/api/test')) as resp:
+            assert resp.status == 200
+        s.shutdown_event.set()
+    assert s.workers == []
+
+  async def test_api_workers_fail_to_start(self):
+    s = ExampleServer()
+    async with asyncio.timeout(60):
+      with self.assertRaisesRegex(RuntimeError, 'worker 0 failed to start'):
+        await s.run_app(log, workers=2, server_factory=_broken_server)
+    assert s.workers == []
+
+  async def test_fused_middleware_matches_stacked(self):
+    paths = [
+      '/api/test',
+      '/api/custom-sec-headers',
+      '/api/fail',
+      '/api/default-aiohttp-error',
+      '/api/400',
+      '/api/400/custom-model',
+      '/api/200/custom-model',
+      '/api/nonpydantic400',
+      '/api/users/notanint',
+      '/api/missing',
+      '/api/constrained',
+    ]
+
+    async def constrained(req: web.Request) -> web.Response:
+      body = ConstrainedBody.model_validate({'count': 0, **await req.json()})
+      return json_response(body.model_dump())
+
+    async def fetch_all(s: ExampleServer):
+      add_route(s, s.app.router, validated_api)
+      s.app.router.add_get('/api/constrained', constrained)
+      results = []
+      async with asyncio.timeout(30):
+        async with asyncio.TaskGroup() as tg:
+          tg.create_task(s.run_app(log))
+          await asyncio.sleep(1)
+          async with aiohttp.ClientSession() as session:
+            for path in paths:
+              async with session.get(URL.build(host=s.host, port=s.port, path=path), json={}) as resp:
+                body = re.sub(r'"request_id": ?"[0-9a-f]*"', '', await resp.text())
+                headers = {k: v for k, v in resp.headers.items() if k not in ('Date', 'Content-Length')}
+                results.append((path, resp.status, headers, body))
+          s.shutdown_event.set()
+      return results
+
+    fused = await fetch_all(ExampleServer(middlewares=default_middleware()))
+    stacked = await fetch_all(ExampleServer(middlewares=default_middleware(fused=False)))
+    assert fused == stacked
+    # the validation error can't be mapped (its ctx has an int in it), so it's a JSON 500
+    path, status, headers, _ = fused[-1]
+    assert (path, status, headers['Content-Type'], headers.get('X-Frame-Options')) == ('/api/constrained', 500, 'application/json; charset=utf-8', 'SAMEORIGIN')
+
   async def test_g_state(self):
     md = default_middleware()
     md.append(g_state)
@@ -324,3 +476,91 @@ class TestBasic(unittest.IsolatedAsyncioTestCase):
             assert resp.status == 200
             assert (await resp.text()) == '{}'
         s.shutdown_event.set()
+
+  async def test_record_json(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      recorder = JSONRecorder(directory=tmp, max_segment_bytes=1, compress=True)
+      dm = default_middleware()
+      dm.append(record_json(recorder))
+      s = ExampleServer(middlewares=dm)
+      s.app.on_cleanup.append(recorder.on_cleanup)
+      async with asyncio.timeout(30):
+        async with asyncio.TaskGroup() as tg:
+          tg.create_task(s.run_app(log))
+          await asyncio.sleep(1)
+          async with aiohttp.ClientSession() as session:
+            async with session.get(URL.build(host=s.host, port=s.port, path='/api/default-aiohttp-error')) as resp:
+              assert resp.status == 507
+            async with session.post(URL.build(host=s.host, port=s.port, path='/api/cookies', query={'x': '1'}), data=b'not json') as resp:
+              assert resp.status == 200
+          s.shutdown_event.set()
+
+      assert recorder.recorded == 2
+      assert recorder.dropped == 0
+      # every line went over the 1 byte segment size
+      assert len(recorder.segments) == 2
+      records = []
+      for path in recorder.segments:
+        with gzip.open(path, mode='rt') as f:
+          records += [json.loads(line) for line in f]
+
+      assert records[0]['method'] == 'GET'
+      assert records[0]['path_qs'] == '/api/default-aiohttp-error'
+      assert records[0]['body'] is None
+      assert records[0]['response']['status'] == 507
+      # recorded before ensure_json_errors turns it into JSON
+      assert records[0]['response']['body_text'] == '507: Insufficient Storage'
+      assert records[1]['path_qs'] == '/api/cookies?x=1'
+      assert records[1]['body_text'] == 'not json'
+      assert records[1]['req_id'] != records[0]['req_id']
+
+  def test_record_json_close(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      recorder = JSONRecorder(directory=tmp, compress=True)
+      for idx in range(3):
+        recorder.submit({'idx': idx, 'body': b'caf\xc3\xa9', 'response': None}, 5)
+      assert recorder.close(5)
+      # a single segment that was never rotated still has its gzip trailer
+      assert len(recorder.segments) == 1
+      with gzip.open(recorder.segments[0], mode='rt') as f:
+        assert [json.loads(line)['idx'] for line in f] == [0, 1, 2]
+
+      recorder.submit({'idx': 3, 'body': b'', 'response': None}, 0)
+      assert recorder.close(5)
+      assert len(recorder.segments) == 2
+      with gzip.open(recorder.segments[1], mode='rt') as f:
+        assert [json.loads(line)['idx'] for line in f] == [3]
+
+  def test_record_json_limits(self):
+    recorder = JSONRecorder(sample_rate=0.0)
+    assert not recorder.sampled()
+
+    recorder = JSONRecorder(max_queue_bytes=3000)
+    with tempfile.TemporaryDirectory() as tmp:
+      recorder.directory = tmp
+      for _ in range(3):
+        recorder.submit({'body': b'', 'response': None}, 1000)
+      assert recorder.flush(5)
+    assert recorder.dropped >= 1
+    assert recorder.recorded == 3 - recorder.dropped
+
+  async def test_stream_response(self):
+    s = ExampleServer()
+    async with asyncio.timeout(30):
+      async with asyncio.TaskGroup() as tg:
+        tg.create_task(s.run_app(log))
+        await asyncio.sleep(1)
+        async with aiohttp.ClientSession() as session:
+          async with session.get(URL.build(host=s.host, port=s.port, path='/api/stream')) as resp:
+            assert resp.status == 200
+            assert resp.content_type == 'application/x-ndjson'
+            assert [json.loads(line) for line in (await resp.text()).splitlines()] == [{'user_id': 0}, {'user_id': 1}, {'user_id': 2}]
+
+          async with session.get(URL.build(host=s.host, port=s.port, path='/api/stream', query={'format': 'array', 'count': '5000'})) as resp:
+            assert resp.status == 200
+            assert resp.content_type == 'application/json'
+            assert await resp.json() == [{'user_id': i} for i in range(5000)]
+
+          async with session.get(URL.build(host=s.host, port=s.port, path='/api/stream', query={'format': 'array', 'count': '0'})) as resp:
+            assert await resp.json() == []
+        s.shutdown_event.set()
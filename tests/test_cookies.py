@@ -2,13 +2,13 @@ import asyncio
 from datetime import timedelta
 import logging
 import unittest
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock, patch
 
 import aiohttp
 from yarl import URL
 
 
-from alxhttp.cookies import RedisHiddenCookie
+from alxhttp.cookies import LocalInvalidation, RedisHiddenCookie, RedisSessionCookie, SecureValueCache, secure_setex
 from alxhttp.json import json_response
 from example.server import ExampleServer
 import redis.asyncio as redis
@@ -34,6 +34,141 @@ class TestCookies(unittest.IsolatedAsyncioTestCase):
       val = await c.get(client, req)
       assert val == 'topsecret'
 
+  async def test_redis_session_cookie(self):
+    c = RedisSessionCookie('mysession', timedelta(days=365), max_expiry_delta=timedelta(hours=1))
+
+    async with redis.Redis(host='localhost', port=7379, db=0) as client:
+      resp = json_response({})
+      await c.set(client, resp, 'topsecret')
+      cookie_value = resp.cookies['mysession'].value
+      assert cookie_value.startswith('mysession_')
+      # the key and the cookie expire together, no later than max_expiry_delta
+      assert 3590 < await client.ttl(f'mysession:{cookie_value}') <= 3600
+
+      req = Mock()
+      req.cookies.get = Mock(return_value=cookie_value)
+      assert await c.get(client, req) == 'topsecret'
+
+      cookie_values = await c.set_many(client, ['a', 'b'])
+      assert await c.get_many(client, [*cookie_values, cookie_value, 'mysession_unknown']) == ['a', 'b', 'topsecret', None]
+
+      await c.invalidate(client, req, json_response({}))
+      assert await c.get(client, req) is None
+
+  async def test_redis_cookie_coalesce(self):
+    c = RedisHiddenCookie('mycookie', timedelta(hours=1), coalesce=True)
+    release = asyncio.Event()
+
+    async def hget(name, key):
+      await release.wait()
+      return b'topsecret'
+
+    client = Mock()
+    client.hget = AsyncMock(side_effect=hget)
+    req = Mock()
+    req.cookies.get = Mock(return_value='mycookie_abc')
+
+    tasks = [asyncio.create_task(c.get(client, req)) for _ in range(20)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*tasks) == ['topsecret'] * 20
+    assert client.hget.await_count == 1
+
+    # never shared between clients
+    other = Mock()
+    other.hget = AsyncMock(return_value=b'othersecret')
+    release.clear()
+    tasks = [asyncio.create_task(c.get(client, req)), asyncio.create_task(c.get(other, req))]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*tasks) == ['topsecret', 'othersecret']
+
+    # off by default
+    assert not RedisHiddenCookie('mycookie', timedelta(hours=1)).coalesce
+
+  async def test_session_cookie_get_many(self):
+    c = RedisSessionCookie('mysession', timedelta(hours=1))
+    client = Mock()
+    client.mget = AsyncMock(return_value=[b'a', None])
+    assert await c.get_many(client, ['mysession_1', 'mysession_2']) == ['a', None]
+    client.mget.assert_awaited_once_with(['mysession:mysession_1', 'mysession:mysession_2'])
+    assert await c.get_many(client, []) == []
+
+    # a malformed cookie value doesn't spoil the rest of the batch
+    client.mget = AsyncMock(return_value=[b'a'])
+    assert await c.get_many(client, ['other_1', 'mysession_1', '']) == [None, 'a', None]
+    client.mget.assert_awaited_once_with(['mysession:mysession_1'])
+    client.mget = AsyncMock()
+    assert await c.get_many(client, ['other_1']) == [None]
+    client.mget.assert_not_awaited()
+
+  async def test_session_cookie_expiry(self):
+    client = Mock()
+    with self.assertRaises(ValueError):
+      await secure_setex(client, 'mysession', ['a'], timedelta(milliseconds=500))
+    with self.assertRaises(ValueError):
+      await RedisSessionCookie('mysession', timedelta(hours=1)).set_many(client, ['a'], timedelta(0, 0, 999999))
+    client.pipeline.assert_not_called()
+
+  def test_secure_value_cache(self):
+    cache = SecureValueCache(maxsize=2, ttl=10, negative_ttl=1)
+    with patch('alxhttp.cookies.monotonic', return_value=100.0) as now:
+      assert cache.get('c', 'c_1') == (False, None)
+      cache.put('c', 'c_1', 'one')
+      cache.put('c', 'c_missing', None)
+      assert cache.get('c', 'c_1') == (True, 'one')
+      assert cache.get('c', 'c_missing') == (True, None)
+
+      # misses expire sooner
+      now.return_value = 105.0
+      assert cache.get('c', 'c_missing') == (False, None)
+      assert cache.get('c', 'c_1') == (True, 'one')
+      now.return_value = 111.0
+      assert cache.get('c', 'c_1') == (False, None)
+
+      # least recently used goes first
+      cache.put('c', 'c_1', 'one')
+      cache.put('c', 'c_2', 'two')
+      cache.get('c', 'c_1')
+      cache.put('c', 'c_3', 'three')
+      assert cache.get('c', 'c_2') == (False, None)
+      assert cache.get('c', 'c_1') == (True, 'one')
+
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 4, 'negative_hits': 1, 'misses': 4, 'evictions': 1, 'hit_rate': 5 / 9}
+
+  async def test_redis_cookie_cache(self):
+    invalidation = LocalInvalidation()
+    caches = [SecureValueCache(invalidation=invalidation) for _ in range(2)]
+    for cache in caches:
+      invalidation.subscribe(cache)
+    cookies = [RedisHiddenCookie('mycookie', timedelta(hours=1), cache=cache) for cache in caches]
+
+    client = Mock()
+    client.hget = AsyncMock(return_value=b'topsecret')
+    client.hdel = AsyncMock()
+    req = Mock()
+    req.cookies.get = Mock(return_value='mycookie_abc')
+
+    for c in cookies:
+      for _ in range(3):
+        assert await c.get(client, req) == 'topsecret'
+    assert client.hget.await_count == 2
+
+    # unset only touches the response
+    resp = json_response({})
+    cookies[0].unset(resp)
+    assert resp.cookies['mycookie'].value == ''
+    client.hdel.assert_not_called()
+
+    await cookies[0].invalidate(client, req, json_response({}))
+    client.hdel.assert_awaited_once_with('mycookie', 'mycookie_abc')
+    client.hget.return_value = None
+    for c in cookies:
+      for _ in range(3):
+        assert await c.get(client, req) is None
+    assert client.hget.await_count == 4
+    assert caches[1].stats()['negative_hits'] == 2
+
   async def test_normal_cookies(self):
     s = ExampleServer()
     async with asyncio.timeout(30):
@@ -0,0 +1,201 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from alxhttp.file import HASHED_NAME, IMMUTABLE_CACHE_CONTROL, StaticDirectory, StaticFile, _accepted_encodings
+from alxhttp.file_watcher import unregister_dir_listener, watch_dir
+
+
+class TestFile(unittest.IsolatedAsyncioTestCase):
+  def test_accepted_encodings(self):
+    assert _accepted_encodings('gzip, deflate, br;q=0.5') == {'gzip', 'deflate', 'br'}
+    assert _accepted_encodings('br;q=0, gzip;q=0.0, identity') == {'identity'}
+    assert _accepted_encodings('') == {''}
+
+  async def test_static_file(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = Path(tmp) / 'app.js'
+      path.write_text('console.log(1)')
+      path.with_name('app.js.gz').write_bytes(gzip.compress(b'console.log(1)'))
+      big = Path(tmp) / 'big.txt'
+      big.write_bytes(b'x' * 1000)
+
+      static = StaticFile(path, cache_control='max-age=60')
+      app = web.Application()
+      app.router.add_get('/app.js', static.handler)
+      app.router.add_get('/big.txt', StaticFile(big, max_cached_size=100).handler)
+      app.router.add_get('/missing.txt', StaticFile(Path(tmp) / 'missing.txt').handler)
+
+      async with TestClient(TestServer(app)) as client:
+        async with client.get('/app.js', headers={'Accept-Encoding': 'identity'}) as resp:
+          assert resp.status == 200
+          assert await resp.text() == 'console.log(1)'
+          assert resp.headers['Content-Type'] == 'text/javascript'
+          assert resp.headers['Cache-Control'] == 'max-age=60'
+          assert resp.headers['Vary'] == 'Accept-Encoding'
+          assert 'Content-Encoding' not in resp.headers
+          etag = resp.headers['ETag']
+
+        async with client.get('/app.js', headers={'Accept-Encoding': 'gzip, br'}, auto_decompress=False) as resp:
+          assert resp.headers['Content-Encoding'] == 'gzip'
+          assert gzip.decompress(await resp.read()) == b'console.log(1)'
+          gzip_etag = resp.headers['ETag']
+        assert gzip_etag != etag
+
+        async with client.get('/app.js', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag}) as resp:
+          assert resp.status == 304
+          assert resp.headers['ETag'] == etag
+        async with client.get('/app.js', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}) as resp:
+          assert resp.status == 200
+
+        # without a file watcher changes are picked up by stat'ing per request
+        path.write_text('console.log(2)')
+        os.remove(path.with_name('app.js.gz'))
+        async with client.get('/app.js', headers={'Accept-Encoding': 'gzip'}) as resp:
+          assert await resp.text() == 'console.log(2)'
+          assert 'Vary' not in resp.headers
+          assert resp.headers['ETag'] != etag
+
+        async with client.get('/big.txt') as resp:
+          assert resp.status == 200
+          assert await resp.read() == b'x' * 1000
+
+        # once known to be too large, it is served without reloading until it changes
+        with patch.object(StaticFile, '_load', side_effect=AssertionError):
+          async with client.get('/big.txt') as resp:
+            assert await resp.read() == b'x' * 1000
+        big.write_bytes(b'small')
+        async with client.get('/big.txt') as resp:
+          assert await resp.read() == b'small'
+          assert 'ETag' in resp.headers
+
+        async with client.get('/missing.txt') as resp:
+          assert resp.status == 404
+
+  async def test_static_file_watcher(self):
+    with tempfile.TemporaryDirectory() as tmp, watch_dir(Path(tmp).resolve()):
+      root = Path(tmp).resolve()
+      path = root / 'app.js'
+      path.write_text('old')
+      static = StaticFile(path)
+      app = web.Application()
+      app.router.add_get('/app.js', static.handler)
+
+      async def wait_for_stale():
+        for _ in range(50):
+          if static._stale:
+            return
+          await asyncio.sleep(0.1)
+
+      async with TestClient(TestServer(app)) as client:
+        async with client.get('/app.js') as resp:
+          assert await resp.text() == 'old'
+        # served from memory without stat'ing while the watcher covers the file
+        with patch('alxhttp.file._stat_key', side_effect=AssertionError):
+          async with client.get('/app.js') as resp:
+            assert await resp.text() == 'old'
+
+        # atomic replace
+        tmp_path = root / 'app.js.tmp'
+        tmp_path.write_text('new')
+        os.replace(tmp_path, path)
+        await wait_for_stale()
+        async with client.get('/app.js') as resp:
+          assert await resp.text() == 'new'
+
+        # a new precompressed sibling
+        path.with_name('app.js.gz').write_bytes(gzip.compress(b'new'))
+        await wait_for_stale()
+        async with client.get('/app.js', headers={'Accept-Encoding': 'gzip'}, auto_decompress=False) as resp:
+          assert resp.headers['Content-Encoding'] == 'gzip'
+
+        os.remove(path)
+        await wait_for_stale()
+        async with client.get('/app.js') as resp:
+          assert resp.status == 404
+
+  def test_hashed_name(self):
+    for name in ['main.3f2a1b4c.js', 'index-BXa9Q2fz.css', 'chunk-5KQ2XQ7B.js', 'chunk.0123456789abcdef.js.map', 'app.3f2a1b4c5d6e7f8a9b0c.js']:
+      assert HASHED_NAME.search(name), name
+    for name in [
+      'index.html',
+      'favicon.ico',
+      'my-component-name.js',
+      'jquery-3.7.1.min.js',
+      'robots.txt',
+      'background-1920x1080.jpg',
+      'report-20240115.pdf',
+      'my-component2024.js',
+      'release-notes_v2024.html',
+      'release-notes.abcdefgh.html',
+    ]:
+      assert not HASHED_NAME.search(name), name
+
+  async def test_static_directory(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      root = Path(tmp).resolve()
+      (root / 'assets').mkdir()
+      (root / 'docs').mkdir()
+      (root / 'index.html').write_text('<p>home</p>')
+      (root / 'docs' / 'index.html').write_text('<p>docs</p>')
+      (root / 'assets' / 'main.3f2a1b4c.js').write_text('console.log(1)')
+      (root / 'assets' / 'main.3f2a1b4c.js.gz').write_bytes(gzip.compress(b'console.log(1)'))
+
+      static = StaticDirectory(root, cache_control='no-cache', watch=False)
+      assert sorted(static.index) == ['', 'assets/main.3f2a1b4c.js', 'docs', 'docs/', 'docs/index.html', 'index.html']
+
+      app = web.Application()
+      static.add_mount(app.router, '/app/')
+      async with TestClient(TestServer(app)) as client:
+        async with client.get('/app/') as resp:
+          assert await resp.text() == '<p>home</p>'
+          assert resp.headers['Cache-Control'] == 'no-cache'
+        async with client.get('/app/docs') as resp:
+          assert await resp.text() == '<p>docs</p>'
+        async with client.get('/app/assets/main.3f2a1b4c.js', headers={'Accept-Encoding': 'gzip'}) as resp:
+          assert await resp.text() == 'console.log(1)'
+          assert resp.headers['Content-Encoding'] == 'gzip'
+          assert resp.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+        for path in ['/app/missing.js', '/app/assets/main.3f2a1b4c.js.gz', '/app/../test_file.py']:
+          async with client.get(path) as resp:
+            assert resp.status == 404, path
+
+        # incremental updates, as the file watcher would send them
+        index = static.index
+        (root / 'new.txt').write_text('new')
+        static._on_change(str(root / 'new.txt'), False)
+        os.remove(root / 'docs' / 'index.html')
+        static._on_change(str(root / 'docs' / 'index.html'), False)
+        assert 'new.txt' in static.index
+        assert 'docs' not in static.index and 'docs/' not in static.index
+        # the old index is left untouched for anyone still using it
+        assert 'new.txt' not in index and 'docs' in index
+
+        async with client.get('/app/new.txt') as resp:
+          assert await resp.text() == 'new'
+        async with client.get('/app/docs/') as resp:
+          assert resp.status == 404
+
+  async def test_static_directory_watcher(self):
+    with tempfile.TemporaryDirectory() as tmp, watch_dir(Path(tmp).resolve()):
+      root = Path(tmp).resolve()
+      static = StaticDirectory(root)
+      try:
+        (root / 'a.txt').write_text('a')
+        (root / 'sub').mkdir()
+        (root / 'sub' / 'b.txt').write_text('b')
+        for _ in range(50):
+          if 'a.txt' in static.index and 'sub/b.txt' in static.index:
+            break
+          await asyncio.sleep(0.1)
+        assert 'a.txt' in static.index
+        assert 'sub/b.txt' in static.index
+      finally:
+        unregister_dir_listener(root)
@@ -5,7 +5,7 @@ import tempfile
 import unittest
 
 
-from alxhttp.file_watcher import register_file_listener, unregister_file_listener, watch_dir
+from alxhttp.file_watcher import _notify_file, _watched_files, register_file_listener, unregister_file_listener, watch_dir
 
 log = logging.getLogger()
 
@@ -58,3 +58,29 @@ class TestFSWatcher(unittest.IsolatedAsyncioTestCase):
         f.write('world')
         f.flush()
       unregister_file_listener(test_file3)
+
+  def test_file_listeners(self):
+    with tempfile.TemporaryDirectory() as td:
+      test_file = str(Path(td) / 'test.txt')
+      calls = []
+
+      def cb1():
+        calls.append(1)
+
+      def cb2():
+        calls.append(2)
+
+      # listeners on the same file are added, not replaced
+      register_file_listener(test_file, cb1)
+      register_file_listener(test_file, cb2)
+      _notify_file(test_file)
+      assert calls == [1, 2]
+
+      unregister_file_listener(test_file, cb1)
+      _notify_file(test_file)
+      assert calls == [1, 2, 2]
+
+      unregister_file_listener(test_file)
+      _notify_file(test_file)
+      assert calls == [1, 2, 2]
+      assert test_file not in _watched_files
@@ -0,0 +1,203 @@
+import asyncio
+import io
+import json
+import logging
+import sys
+import threading
+import unittest
+from unittest.mock import ANY, Mock, patch
+
+import aiohttp
+from yarl import URL
+
+from alxhttp.logging import AccessLogEntry, AccessLogSampler, AccessLogWriter, JSONFormatter, JSONLogFilter, QueuedJSONAccessLogger, get_json_server_logger
+from alxhttp.req_id import current_log_context, current_request
+from example.server import ExampleServer
+
+log = logging.getLogger()
+
+
+def _entry(status: int = 200) -> AccessLogEntry:
+  return AccessLogEntry('GET', 'http', 'localhost:8080', URL('/api/test?x=1'), status, 0.0012345678912, 42, 'abc', '')
+
+
+class BlockingStream(io.StringIO):
+  def __init__(self):
+    super().__init__()
+    self.release = threading.Event()
+    self.writes = 0
+
+  def write(self, s: str) -> int:
+    self.release.wait()
+    self.writes += 1
+    return super().write(s)
+
+
+class TestLogging(unittest.IsolatedAsyncioTestCase):
+  def test_entry_to_json(self):
+    assert json.loads(_entry().to_json()) == {
+      'message': 'GET /api/test 200',
+      'duration': 0.00123457,
+      'time_ns': 42,
+      'http': {'method': 'GET', 'status_code': 200, 'url': 'http://localhost:8080/api/test?x=1'},
+      'component': 'aiohttp',
+      'request_id': 'abc',
+      'traceId': '',
+    }
+
+  def test_json_formatter(self):
+    formatter = JSONFormatter()
+    tag = JSONLogFilter(rewrite_msg=False)
+
+    token = current_log_context.set(('abc', 'trace'))
+    try:
+      record = logging.LogRecord('x', logging.INFO, __file__, 1, 'hello %s', ('world',), None)
+      assert tag.filter(record)
+    finally:
+      current_log_context.reset(token)
+
+    assert record.msg == 'hello %s'
+    assert json.loads(formatter.format(record)) == {'time_ns': ANY, 'request_id': 'abc', 'traceId': 'trace', 'message': 'hello world'}
+
+    record = logging.LogRecord('x', logging.INFO, __file__, 1, {'message': 'hi', 'extra': [1]}, None, None)
+    assert json.loads(formatter.format(record)) == {'time_ns': ANY, 'request_id': None, 'traceId': None, 'message': 'hi', 'extra': [1]}
+
+    try:
+      raise ValueError('uh oh')
+    except ValueError:
+      record = logging.LogRecord('x', logging.ERROR, __file__, 1, 'failed', None, sys.exc_info())
+    line = json.loads(formatter.format(record))
+    assert line['message'] == 'failed'
+    assert 'ValueError: uh oh' in line['exc_info']
+
+  def test_json_log_filter(self):
+    tag = JSONLogFilter()
+    request = Mock()
+    request.get = lambda key, default=None: {'__req_id_middleware': 'abc', '__req_id_middleware_trace_id': 'trace'}.get(key, default)
+    # ids come from current_request when that's all that was set
+    token = current_request.set(request)
+    try:
+      record = logging.LogRecord('x', logging.INFO, __file__, 1, {'message': 'hi', 'extra': [1]}, None, None)
+      assert tag.filter(record)
+    finally:
+      current_request.reset(token)
+    assert json.loads(record.msg) == {'time_ns': ANY, 'request_id': 'abc', 'traceId': 'trace', 'message': 'hi', 'extra': [1]}
+    assert (record.request_id, record.traceId) == ('abc', 'trace')
+
+  def test_json_server_logger(self):
+    logger = get_json_server_logger()
+    handlers = list(logger.handlers)
+    propagate = logger.propagate
+    json_filter = next(f for f in logger.filters if isinstance(f, JSONLogFilter))
+    try:
+      assert get_json_server_logger() is logger
+      assert len([f for f in logger.filters if isinstance(f, JSONLogFilter)]) == 1
+      assert logger.handlers == handlers
+      assert json_filter.rewrite_msg
+
+      get_json_server_logger(json_handler=True)
+      get_json_server_logger(json_handler=True)
+      get_json_server_logger()
+      added = [h for h in logger.handlers if h not in handlers]
+      assert len(added) == 1
+      assert isinstance(added[0].formatter, JSONFormatter)
+      assert not json_filter.rewrite_msg
+      assert logger.propagate == propagate
+    finally:
+      json_filter.rewrite_msg = True
+      logger.handlers = handlers
+
+  def test_writer_batches(self):
+    stream = BlockingStream()
+    writer = AccessLogWriter(stream=stream)
+    for _ in range(100):
+      writer.submit(_entry())
+    stream.release.set()
+    assert writer.flush(5)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 100
+    # the first entry is written on its own while the rest queue up behind it
+    assert stream.writes <= 2
+
+  def test_writer_drops_on_overflow(self):
+    stream = BlockingStream()
+    writer = AccessLogWriter(stream=stream, max_queue=10, batch_size=1)
+    for _ in range(50):
+      writer.submit(_entry())
+    assert writer.dropped >= 39
+    stream.release.set()
+    assert writer.flush(5)
+    assert len(stream.getvalue().splitlines()) == 50 - writer.dropped
+
+  def test_sampler_probability(self):
+    sampler = AccessLogSampler(rate=0.0, route_rates={'/api/hot': 0.25}, slow_threshold=0.5)
+    assert sampler.sample('/api/test', 200, 0.01) is None
+    assert sampler.sample('/api/test', 404, 0.01) == 1.0
+    assert sampler.sample('/api/test', 503, 0.01) == 1.0
+    assert sampler.sample('/api/test', 200, 0.6) == 1.0
+
+    kept = [sampler.sample('/api/hot', 200, 0.01) for _ in range(4000)]
+    assert set(kept) == {None, 0.25}
+    assert 800 < kept.count(0.25) < 1200
+
+    assert AccessLogSampler().sample('/api/test', 200, 0.01) == 1.0
+
+  def test_sampler_token_bucket(self):
+    sampler = AccessLogSampler(per_second=5, burst=5)
+    now = [1000.0]
+    with patch('alxhttp.logging.monotonic', lambda: now[0]):
+      kept = [sampler.sample('/api/test', 200, 0.01) for _ in range(100)]
+      rates = [x for x in kept if x is not None]
+      # the burst goes through, the rest of this second is dropped. There's no previous
+      # second to estimate the rate from yet
+      assert rates == [1.0] * 5
+      assert sampler.totals() == {'/api/test': (100, 5)}
+
+      # a burst at the start of the next second is tagged with what was actually kept
+      now[0] += 1.0
+      kept = [sampler.sample('/api/test', 200, 0.01) for _ in range(100)]
+      rates = [x for x in kept if x is not None]
+      assert rates == [5 / 100] * 5
+      assert sampler.totals() == {'/api/test': (200, 10)}
+
+      # after a quiet second there's nothing to go on again
+      now[0] += 2.5
+      assert sampler.sample('/api/test', 200, 0.01) == 1.0
+    # routes have their own buckets and errors are never limited
+    assert sampler.sample('/api/other', 200, 0.01) == 1.0
+    assert sampler.sample('/api/test', 500, 0.01) == 1.0
+
+  async def test_server_access_log(self):
+    stream = io.StringIO()
+
+    class TestAccessLogger(QueuedJSONAccessLogger):
+      writer = AccessLogWriter(stream=stream)
+      sampler = AccessLogSampler(rate=0.0)
+
+    access_log = logging.getLogger('aiohttp.access')
+    old_level = access_log.level
+    access_log.setLevel(logging.INFO)
+    try:
+      s = ExampleServer()
+      s.access_log_class = TestAccessLogger
+      async with asyncio.timeout(30):
+        async with asyncio.TaskGroup() as tg:
+          tg.create_task(s.run_app(log))
+          await asyncio.sleep(1)
+          async with aiohttp.ClientSession() as session:
+            for _ in range(3):
+              async with session.get(URL.build(host=s.host, port=s.port, path='/api/test')) as resp:
+                assert resp.status == 200
+              async with session.get(URL.build(host=s.host, port=s.port, path='/api/fail')) as resp:
+                assert resp.status == 500
+          s.shutdown_event.set()
+    finally:
+      access_log.setLevel(old_level)
+
+    lines = [json.loads(x) for x in stream.getvalue().splitlines()]
+    # only the errors survive sampling
+    assert len(lines) == 3
+    assert lines[0]['message'] == 'GET /api/fail 500'
+    assert lines[0]['http']['url'] == f'http://{s.host}:{s.port}/api/fail'
+    assert lines[0]['request_id']
+    assert lines[0]['sample_rate'] == 1.0
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import tempfile
+import unittest
+
+import aiohttp
+from aiohttp import web
+from yarl import URL
+
+from alxhttp.metrics import MetricsRegistry, _response_size, metrics_middleware
+from alxhttp.middleware.defaults import default_middleware
+from alxhttp.pydantic.route import add_route
+from example.server import ExampleServer, validated_api
+
+log = logging.getLogger()
+
+
+class TestMetrics(unittest.TestCase):
+  def test_render(self):
+    registry = MetricsRegistry(latency_buckets=[0.1, 0.01], size_buckets=[100])
+    m = registry.route('GET', '/api/users/{user_id}')
+    m.observe(200, 0.005, 50)
+    m.observe(200, 0.05, 500)
+    m.observe(404, 1.0, 0)
+    registry.route('GET', 'a "quoted"\nroute')
+
+    lines = registry.render().splitlines()
+    labels = 'method="GET",route="/api/users/{user_id}"'
+    assert f'alxhttp_requests_total{{{labels},status="200"}} 2' in lines
+    assert f'alxhttp_requests_total{{{labels},status="404"}} 1' in lines
+    assert f'alxhttp_requests_in_flight{{{labels}}} 0' in lines
+    assert f'alxhttp_request_duration_seconds_bucket{{{labels},le="0.01"}} 1' in lines
+    assert f'alxhttp_request_duration_seconds_bucket{{{labels},le="0.1"}} 2' in lines
+    assert f'alxhttp_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f'alxhttp_request_duration_seconds_count{{{labels}}} 3' in lines
+    assert f'alxhttp_response_size_bytes_bucket{{{labels},le="100"}} 2' in lines
+    assert f'alxhttp_response_size_bytes_sum{{{labels}}} 550' in lines
+    assert 'alxhttp_requests_in_flight{method="GET",route="a \\"quoted\\"\\nroute"} 0' in lines
+
+  def test_response_size(self):
+    with tempfile.NamedTemporaryFile() as f:
+      assert _response_size(web.Response(body=b'abc')) == 3
+      assert _response_size(web.Response(status=204)) == 0
+      assert _response_size(web.HTTPNotFound(text='nope')) == 4
+      # not known until they're sent, so not observed
+      assert _response_size(web.StreamResponse()) is None
+      assert _response_size(web.FileResponse(f.name)) is None
+
+    m = MetricsRegistry(size_buckets=[100]).route('GET', '/api/stream')
+    m.observe(200, 0.1, None)
+    m.observe(200, 0.1, 10)
+    assert m.size_counts == [1, 0]
+    assert sum(m.latency_counts) == 2
+
+
+class TestMetricsServer(unittest.IsolatedAsyncioTestCase):
+  async def test_metrics_endpoint(self):
+    registry = MetricsRegistry()
+    s = ExampleServer(middlewares=[metrics_middleware(registry), *default_middleware()])
+    add_route(s, s.app.router, validated_api)
+    registry.add_endpoint(s.app.router)
+    async with asyncio.timeout(30):
+      async with asyncio.TaskGroup() as tg:
+        tg.create_task(s.run_app(log))
+        await asyncio.sleep(1)
+        async with aiohttp.ClientSession() as session:
+          for user_id in ('1', '2', 'notanint'):
+            async with session.get(URL.build(host=s.host, port=s.port, path=f'/api/users/{user_id}'), json={'user_name': 'Alex'}) as resp:
+              await resp.read()
+          async with session.get(URL.build(host=s.host, port=s.port, path='/nope')) as resp:
+            assert resp.status == 404
+          async with session.get(URL.build(host=s.host, port=s.port, path='/metrics')) as resp:
+            assert resp.status == 200
+            assert resp.content_type == 'text/plain'
+            lines = (await resp.text()).splitlines()
+        s.shutdown_event.set()
+
+    assert 'alxhttp_requests_total{method="GET",route="/api/users/{user_id}",status="200"} 2' in lines
+    assert 'alxhttp_requests_total{method="GET",route="/api/users/{user_id}",status="400"} 1' in lines
+    assert 'alxhttp_requests_total{method="GET",route="<unmatched>",status="404"} 1' in lines
+    # the scrape itself is still in flight
+    assert 'alxhttp_requests_in_flight{method="GET",route="/metrics"} 1' in lines
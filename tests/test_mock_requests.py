@@ -93,6 +93,22 @@ class TestMockReqs(unittest.IsolatedAsyncioTestCase):
 
     assert json.loads(json.dumps(ve.value.errors())) == [{'type': 'string_type', 'loc': ['body', 'user_name'], 'msg': 'Input should be a valid string', 'input': 42, 'url': ANY}]
 
+  async def test_mock_request_to_validated_api_with_bad_json(self):
+    s = ExampleServer()
+    req = make_mocked_request(
+      'GET',
+      '/api/users/abc',
+      payload=BytesStreamReader(b'{"user_name": '),
+    )
+    req.match_info['user_id'] = 'abc'
+    with pytest.raises(ValidationError) as ve:
+      await validated_api(s, req)
+
+    assert [(e['type'], e['loc']) for e in ve.value.errors()] == [
+      ('int_parsing', ('match_info', 'user_id')),
+      ('json_invalid', ('body',)),
+    ]
+
   async def test_mock_request_with_json_body(self):
     s = ExampleServer()
     input_data = {'foo': 42}
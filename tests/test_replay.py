@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+
+from alxhttp.replay import _percentile, load_recorded_requests, replay_app
+from example.server import ExampleServer
+
+
+def _write_recording(directory: str) -> str:
+  path = os.path.join(directory, 'recording.jsonl')
+  records = [
+    {'method': 'GET', 'path_qs': '/api/test', 'route': '/api/test', 'headers': {'Host': 'example.com', 'Accept': '*/*'}, 'body': None},
+    {'method': 'GET', 'path_qs': '/api/fail', 'route': '/api/fail', 'headers': {}, 'body': None},
+    {'method': 'POST', 'path_qs': '/api/cookies?x=1', 'headers': {}, 'body_text': 'not json'},
+  ]
+  with open(path, mode='w') as f:
+    f.writelines(json.dumps(r) + '\n' for r in records)
+  return path
+
+
+class TestReplay(unittest.IsolatedAsyncioTestCase):
+  def test_percentile(self):
+    ordered = [float(x) for x in range(1, 101)]
+    assert _percentile(ordered, 50) == 50.0
+    assert _percentile(ordered, 99) == 99.0
+    assert _percentile([1.0], 95) == 1.0
+    assert _percentile([], 50) == 0.0
+
+  def test_load(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      requests = load_recorded_requests([_write_recording(tmp)])
+    assert [r.route for r in requests] == ['GET /api/test', 'GET /api/fail', 'POST /api/cookies']
+    assert requests[0].headers == {'Accept': '*/*'}
+    assert requests[0].body is None
+    assert requests[2].body == b'not json'
+
+  async def test_replay(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      requests = load_recorded_requests([_write_recording(tmp)])
+
+    report = await replay_app(ExampleServer().app, requests, count=30, concurrency=4)
+    assert report['mode'] == 'concurrency'
+    assert report['count'] == 30
+    assert report['errors'] == 10
+    assert report['routes']['GET /api/test']['statuses'] == {'200': 10}
+    assert report['routes']['GET /api/fail']['error_rate'] == 1.0
+    latency = report['routes']['POST /api/cookies']['latency_ms']
+    assert 0 < latency['p50'] <= latency['p95'] <= latency['p99'] <= latency['max']
+
+    report = await replay_app(ExampleServer().app, requests, count=10, rps=200)
+    assert report['mode'] == 'rps'
+    assert report['count'] == 10
+    # report is plain JSON
+    json.dumps(report)
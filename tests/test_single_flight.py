@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+
+import pytest
+
+from alxhttp.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+  async def test_coalesces(self):
+    flights: SingleFlight[str, int] = SingleFlight()
+    started = 0
+    release = asyncio.Event()
+
+    async def fetch() -> int:
+      nonlocal started
+      started += 1
+      await release.wait()
+      return started
+
+    tasks = [asyncio.create_task(flights.do('a', fetch)) for _ in range(20)]
+    other = asyncio.create_task(flights.do('b', fetch))
+    await asyncio.sleep(0)
+    assert len(flights) == 2
+    release.set()
+    assert set(await asyncio.gather(*tasks)) == {1}
+    assert await other == 2
+    assert (flights.calls, flights.coalesced, len(flights)) == (2, 19, 0)
+
+    # nothing is remembered once the call is done
+    assert await flights.do('a', fetch) == 3
+
+  async def test_errors_and_cancellation(self):
+    flights: SingleFlight[str, int] = SingleFlight()
+    release = asyncio.Event()
+
+    async def fail() -> int:
+      await release.wait()
+      raise ValueError('uh oh')
+
+    first = asyncio.create_task(flights.do('a', fail))
+    second = asyncio.create_task(flights.do('a', fail))
+    await asyncio.sleep(0)
+    # the caller that started the call going away doesn't cancel it for the other
+    first.cancel()
+    release.set()
+    with pytest.raises(ValueError):
+      await second
+    assert first.cancelled()
+    assert len(flights) == 0
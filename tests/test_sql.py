@@ -1,19 +1,42 @@
 import asyncio
 import logging
+import os
+import tempfile
 import unittest
 from contextlib import asynccontextmanager
-from unittest.mock import ANY
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import ANY, patch
 
 import aiohttp
+import asyncpg
 import pytest
 from asyncpg import create_pool
 from yarl import URL
 
+from alxhttp.file_watcher import _watched_files
 from alxhttp.middleware.defaults import default_middleware
 from alxhttp.pydantic.basemodel import Empty
 from alxhttp.pydantic.route import add_route
-from alxhttp.sql import SQLValidator
-from example.sqlserver import ExampleServer, get_org, get_org_invalid, get_users_for_org, get_users_for_org_list, get_users_for_org_valid_args
+from alxhttp.req_id import current_log_context
+from alxhttp.sql import (
+  SQLTiming,
+  SQLValidator,
+  StatementCacheStats,
+  _records_size,
+  _status_size,
+  disable_lazy_sql,
+  disable_sql_timing,
+  disable_sql_validation_cache,
+  enable_lazy_sql,
+  enable_sql_timing,
+  enable_sql_validation_cache,
+  get_sql_stats,
+  validate_sql,
+  validate_sql_files,
+  warm_up_sql,
+)
+from example.sqlserver import CREATE_ORGS, GET_ORG_USERS_VA, ExampleServer, NewOrg, Org, get_org, get_org_invalid, get_users_for_org, get_users_for_org_list, get_users_for_org_valid_args
 
 log = logging.getLogger()
 
@@ -52,6 +75,219 @@ class TestSQL(unittest.IsolatedAsyncioTestCase):
     assert s.query == 'select\n  *\nfrom\n  sometable;'
     assert str(s) == 'select\n  *\nfrom\n  sometable;'
 
+  async def test_lazy_sql(self):
+    enable_lazy_sql()
+    try:
+      s = SQLValidator('test_sql.valid_sql.sql', Empty)
+      t = SQLValidator('test_sql.valid_sql.sql', Empty)
+    finally:
+      disable_lazy_sql()
+    assert s.file == Path(__file__).parent / 'test_sql.valid_sql.sql'
+    assert s._query is None
+    _watched_files.pop(str(s.file), None)
+
+    # first use
+    assert s.query == 'select\n  *\nfrom\n  sometable;'
+    assert str(s.file) in _watched_files
+
+    # or everything at once
+    with patch('alxhttp.sql._validators', {s, t}):
+      await warm_up_sql()
+    assert t._query == s.query
+
+  def test_sql_validation_cache(self):
+    with tempfile.TemporaryDirectory() as tmp, patch.dict(os.environ, {'ALXHTTP_SQL_CACHE_DIR': os.path.join(tmp, 'cache')}):
+      sql_file = Path(tmp) / 'query.sql'
+      sql_file.write_text('select 1;')
+      assert validate_sql(sql_file) == 'select 1;'
+      with patch('pglast.parser.parse_sql') as parse_sql:
+        assert validate_sql(sql_file) == 'select 1;'
+        parse_sql.assert_not_called()
+
+      # A change to the file is a different key, and failures are never cached
+      sql_file.write_text('select from where;')
+      for _ in range(2):
+        with pytest.raises(ValueError):
+          validate_sql(sql_file)
+
+  def test_sql_validation_cache_opt_in(self):
+    with tempfile.TemporaryDirectory() as tmp, patch.dict(os.environ, {'ALXHTTP_SQL_CACHE_DIR': '', 'XDG_CACHE_HOME': tmp}):
+      sql_file = Path(tmp) / 'query.sql'
+      sql_file.write_text('select 1;')
+      # off unless asked for
+      validate_sql(sql_file)
+      assert not (Path(tmp) / 'alxhttp').exists()
+
+      try:
+        assert enable_sql_validation_cache() == Path(tmp) / 'alxhttp' / 'sql'
+        validate_sql(sql_file)
+        with patch('pglast.parser.parse_sql') as parse_sql:
+          validate_sql(sql_file)
+          parse_sql.assert_not_called()
+      finally:
+        disable_sql_validation_cache()
+
+  def test_validate_sql_files(self):
+    with tempfile.TemporaryDirectory() as tmp, patch.dict(os.environ, {'ALXHTTP_SQL_CACHE_DIR': ''}):
+      files = []
+      for idx in range(10):
+        files.append(Path(tmp) / f'{idx}.sql')
+        files[-1].write_text(f'select {idx};')
+      texts = validate_sql_files(files, max_workers=2)
+      assert texts == {f: f'select {idx};' for idx, f in enumerate(files)}
+
+      files[3].write_text('select from where;')
+      with pytest.raises(ValueError) as e:
+        validate_sql_files(files, max_workers=2)
+      assert str(files[3]) in e.value.args[0]
+      assert str(files[4]) not in e.value.args[0]
+
+  def test_sql_timing(self):
+    assert _records_size([{'a': 'hello', 'b': b'xy', 'c': 5, 'd': None}, {'a': '{}'}]) == (2, 5 + 2 + 8 + 2)
+    assert _status_size('INSERT 0 5') == (5, 0)
+    assert _status_size('CREATE TABLE') == (0, 0)
+
+    timing = SQLTiming(slow_threshold=0.5, logger=log)
+    token = current_log_context.set(('abc', None))
+    try:
+      with self.assertLogs(log, level='WARNING') as logs:
+        timing.observe(Path('/sql/slow.sql'), 0.75, 10, 1000)
+    finally:
+      current_log_context.reset(token)
+    timing.observe(Path('/sql/slow.sql'), 0.25, 0, 0, error=True)
+
+    assert logs.records[0].msg == {'message': 'Slow SQL query', 'request_id': 'abc', 'sql_file': 'slow.sql', 'duration': 0.75, 'rows': 10, 'bytes_decoded': 1000, 'error': False}
+    stats = timing.stats['slow.sql']
+    assert (stats.calls, stats.errors, stats.slow_calls, stats.rows, stats.bytes_decoded) == (2, 1, 1, 10, 1000)
+    assert stats.total_time == 1.0
+    assert stats.max_time == 0.75
+
+  async def test_sql_timing_queries(self):
+    get_org = SQLValidator('../example/sqlserver_get_org.sql', Org)
+    enable_sql_timing(slow_threshold=60, logger=log)
+    try:
+      async with run_server() as (pool, _):
+        async with pool.acquire() as conn:
+          await get_org.fetch(conn, 'org_a1b2c3d4e5f6')
+          await get_org.fetchrow(conn, 'org_a1b2c3d4e5f6')
+      stats = get_sql_stats()['example/sqlserver_get_org.sql']
+      assert stats.calls == 2
+      assert stats.rows == 2
+      assert stats.bytes_decoded > 0
+    finally:
+      disable_sql_timing()
+    assert get_sql_stats() == {}
+
+  async def test_sql_timing_cursor_closed_early(self):
+    get_org = SQLValidator('../example/sqlserver_get_org.sql', Org)
+    now = datetime.now(timezone.utc)
+
+    class Conn:
+      def is_in_transaction(self):
+        return True
+
+      async def prepare(self, query):
+        return self
+
+      async def cursor(self, *args, prefetch):
+        for idx in range(3):
+          yield {'org_id': 'org_a1b2c3d4e5f6', 'org_name': f'Org {idx}', 'created_at': now, 'updated_at': now}
+
+    timing = enable_sql_timing(slow_threshold=60, logger=log)
+    try:
+      orgs = get_org.cursor(Conn(), 'org_a1b2c3d4e5f6')  # type: ignore
+      async for _ in orgs:
+        break
+      await orgs.aclose()
+      stats = timing.stats['example/sqlserver_get_org.sql']
+      assert (stats.calls, stats.errors, stats.rows) == (1, 0, 1)
+    finally:
+      disable_sql_timing()
+
+  async def test_statement_reuse(self):
+    get_org = SQLValidator('../example/sqlserver_get_org.sql', Org)
+    async with run_server() as (pool, _):
+      for _ in range(3):
+        async with pool.acquire() as conn:
+          orgs = await get_org.fetch(conn, 'org_a1b2c3d4e5f6')
+          assert [o.org_name for o in orgs] == ['Organization One']
+
+      # a reload is just a different query text to asyncpg's statement cache
+      get_org.validate()
+      async with pool.acquire() as conn:
+        org = await get_org.fetchrow(conn, 'org_a1b2c3d4e5f6')
+        assert org.org_name == 'Organization One'
+      # pooled connections don't go through the validator's own statements
+      assert get_org.statement_stats == StatementCacheStats(invalidations=1)
+
+    conn = await asyncpg.connect(user='postgres', host='127.0.0.1', port=6432, database='postgres', password='test')
+    try:
+      for _ in range(3):
+        org = await get_org.fetchrow(conn, 'org_a1b2c3d4e5f6')
+        assert org.org_name == 'Organization One'
+      assert get_org.statement_stats == StatementCacheStats(hits=2, misses=1, invalidations=1)
+
+      get_org.validate()
+      await get_org.fetch(conn, 'org_a1b2c3d4e5f6')
+      assert get_org.statement_stats == StatementCacheStats(hits=2, misses=2, invalidations=2)
+    finally:
+      await conn.close()
+
+  async def test_statement_cache(self):
+    get_org = SQLValidator('../example/sqlserver_get_org.sql', Org)
+
+    class Statement:
+      def __init__(self, query):
+        self.query = query
+
+      async def fetch(self, *args):
+        return []
+
+    class Conn:
+      def __init__(self):
+        self.prepared = []
+
+      async def prepare(self, query):
+        self.prepared.append(query)
+        return Statement(query)
+
+    a, b = Conn(), Conn()
+    for conn in (a, b, a, a, b):
+      assert await get_org.fetch(conn, 'org_a1b2c3d4e5f6') == []  # type: ignore
+    assert len(a.prepared) == len(b.prepared) == 1
+    assert get_org.statement_stats == StatementCacheStats(hits=3, misses=2)
+
+    # a reload prepares the new SQL on next use
+    get_org.validate()
+    await get_org.fetch(a, 'org_a1b2c3d4e5f6')  # type: ignore
+    assert len(a.prepared) == 2
+    assert get_org.statement_stats == StatementCacheStats(hits=3, misses=3, invalidations=1)
+
+  async def test_cursor(self):
+    get_org = SQLValidator('../example/sqlserver_get_org.sql', Org)
+    async with run_server() as (pool, _):
+      async with pool.acquire() as conn:
+        orgs = [org async for org in get_org.cursor(conn, 'org_a1b2c3d4e5f6', batch_size=1)]
+        assert [o.org_name for o in orgs] == ['Organization One']
+
+        async with conn.transaction():
+          orgs = [org async for org in GET_ORG_USERS_VA.cursor(conn, org_id='org_a1b2c3d4e5f6')]
+          assert [len(o.users) for o in orgs] == [3]
+
+  async def test_bulk_writes(self):
+    async with run_server() as (pool, _):
+      async with pool.acquire() as conn:
+        tr = conn.transaction()
+        await tr.start()
+        try:
+          await CREATE_ORGS.execute_many(conn, [NewOrg(org_id=f'org_00000000000{i}', org_name=f'Bulk {i}') for i in range(3)])
+          status = await CREATE_ORGS.copy_records(conn, 'orgs', [NewOrg(org_id=f'org_10000000000{i}', org_name=f'Copy {i}') for i in range(3)], schema_name='usermodel')
+          assert status == 'COPY 3'
+          count = await conn.fetchval("select count(*) from usermodel.orgs where org_name like 'Bulk %' or org_name like 'Copy %'")
+          assert count == 6
+        finally:
+          await tr.rollback()
+
   async def test_api_orgs_users(self):
     async with run_server() as (pool, tg):
       s = ExampleServer(pool)